@@ -32,5 +32,6 @@ else:
 from pikzie.tester import Tester
 from pikzie.core import *
 from pikzie.decorators import *
+from pikzie.fixtures import *
 from pikzie.module_base import *
 from pikzie.utils import *
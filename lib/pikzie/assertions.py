@@ -124,9 +124,8 @@ class Assertions(object):
         if expected == actual:
             self._pass_assertion()
         else:
-            formatted_expected = pp.format(expected)
-            formatted_actual = pp.format(actual)
-            self._fail("", message, formatted_expected, formatted_actual)
+            self._fail("", message,
+                       pp.LazyFormat(expected), pp.LazyFormat(actual))
 
     def assert_not_equal(self, not_expected, actual, message=None):
         """
@@ -0,0 +1,160 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import asyncio
+from inspect import isawaitable
+
+from pikzie.core import *
+from pikzie.core import AssertionFailure, PendingTestError, OmissionTestError
+from pikzie.parallel import EventRecorder, replay_events
+
+__all__ = ["run_concurrently", "run_test"]
+
+def run_concurrently(context, test_case, tests, concurrency,
+                     teardown_test_case=None):
+    """
+    Runs async tests on an event loop at most concurrency tests
+    at a time.
+
+    Each test is ran with its own context that shares fixtures
+    and listeners that have true run_in_worker attribute with
+    context. Events of a test are reported to context when the
+    test is finished so that listeners see them in the same
+    order as sequential run. teardown_test_case is called by
+    the test torn down last. When a test is interrupted, context
+    is interrupted and tests that aren't started yet are skipped.
+    """
+    if len(tests) == 0:
+        return
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(_run_tests(context, test_case, tests,
+                                           concurrency, teardown_test_case))
+    finally:
+        loop.close()
+
+async def _run_tests(context, test_case, tests, concurrency,
+                     teardown_test_case):
+    semaphore = asyncio.Semaphore(concurrency)
+    listeners = [listener for listener in context.listeners
+                 if getattr(listener, "run_in_worker", False)]
+    n_running_tests = [len(tests)]
+    def teardown_test_case_if_last():
+        n_running_tests[0] -= 1
+        if n_running_tests[0] == 0 and teardown_test_case is not None:
+            return teardown_test_case()
+
+    async def run(test):
+        async with semaphore:
+            if context.need_interrupt():
+                return []
+            recorder = EventRecorder(tests)
+            test_context = TestRunnerContext()
+            test_context.concurrent = True
+            test_context.fixtures = context.fixtures
+            test_context.add_listeners(listeners)
+            test_context.add_listener(recorder)
+            await run_test(test, test_context, teardown_test_case_if_last)
+            if test_context.need_interrupt():
+                context.interrupt()
+            return recorder.events
+
+    # Tasks are created in order so that tests are started in order.
+    tasks = [asyncio.ensure_future(run(test)) for test in tests]
+    for finished_test in asyncio.as_completed(tasks):
+        events = await finished_test
+        replay_events(context, test_case, tests, events)
+
+async def _wait(result):
+    if isawaitable(result):
+        return await result
+    return result
+
+async def _run_phase(test, context, phase, call):
+    context.on_start_phase(test, phase)
+    try:
+        await _wait(call())
+    finally:
+        context.on_finish_phase(test, phase)
+
+def _call_setup(test, context):
+    test._prepare_fixtures(context)
+    return test._call_setup()
+
+async def _run_teardown_test_case(test, context, teardown_test_case):
+    try:
+        await _wait(teardown_test_case())
+    except KeyboardInterrupt:
+        context.interrupt()
+    except:
+        test._report_fault(context, sys.exc_info())
+        return False
+    return True
+
+async def run_test(test, context, teardown_test_case=None):
+    "The coroutine version of TestCase.run."
+    success = False
+    try:
+        test._started(context)
+
+        try:
+            try:
+                await _run_phase(test, context, "setup",
+                                 lambda: _call_setup(test, context))
+            except PendingTestError:
+                test._pend_test(context)
+            except OmissionTestError:
+                test._omit_test(context)
+            except KeyboardInterrupt:
+                context.interrupt()
+                return
+            except:
+                test._add_error(context)
+                return
+
+            try:
+                await _run_phase(test, context, "test", test._call_test)
+                success = True
+            except AssertionFailure:
+                test._add_failure(context)
+            except PendingTestError:
+                test._pend_test(context)
+            except OmissionTestError:
+                test._omit_test(context)
+            except KeyboardInterrupt:
+                context.interrupt()
+                return
+            except:
+                test._add_error(context)
+        finally:
+            try:
+                await _run_phase(test, context, "teardown", test._call_teardown)
+            except PendingTestError:
+                test._pend_test(context)
+            except OmissionTestError:
+                test._omit_test(context)
+            except KeyboardInterrupt:
+                context.interrupt()
+            except:
+                test._add_error(context)
+                success = False
+
+    finally:
+        if teardown_test_case is not None:
+            if not await _run_teardown_test_case(test, context,
+                                                 teardown_test_case):
+                success = False
+        test._finished(success, context)
@@ -0,0 +1,84 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import math
+
+__all__ = ["Benchmark", "measure"]
+
+_timer = getattr(time, "perf_counter", time.time)
+
+class Benchmark(object):
+    "Statistics of elapsed times of repeated runs."
+    def __init__(self, elapsed_times, baseline=None):
+        self.runs = len(elapsed_times)
+        sorted_times = sorted(elapsed_times)
+        self.min = sorted_times[0]
+        middle = self.runs // 2
+        if self.runs % 2 == 1:
+            self.median = sorted_times[middle]
+        else:
+            self.median = (sorted_times[middle - 1] + sorted_times[middle]) / 2
+        mean = sum(sorted_times) / self.runs
+        variance = sum([(elapsed - mean) ** 2
+                        for elapsed in sorted_times]) / self.runs
+        self.stddev = math.sqrt(variance)
+        self.baseline = baseline
+
+    def update_baseline(self, store, id):
+        """
+        Loads the baseline of the test identified by id from
+        store. The median is stored as the baseline if there
+        is no baseline.
+        """
+        self.baseline = store.get(id, "benchmark_baseline")
+        store.update(id, benchmark_median=self.median)
+        if self.baseline is None:
+            store.update(id, benchmark_baseline=self.median)
+
+    def is_regressed(self, max_regression):
+        "Returns True if median / baseline is larger than max_regression."
+        ratio = self.ratio()
+        if ratio is None or max_regression is None:
+            return False
+        return ratio > max_regression
+
+    def ratio(self):
+        "Returns median / baseline or None if there is no baseline."
+        if not self.baseline:
+            return None
+        return self.median / self.baseline
+
+    def __str__(self):
+        result = "median: %.6f, min: %.6f, stddev: %.6f, runs: %d" % \
+            (self.median, self.min, self.stddev, self.runs)
+        ratio = self.ratio()
+        if ratio is not None:
+            result += ", baseline: %.6f (%.2fx)" % (self.baseline, ratio)
+        return result
+
+def measure(function, repeat=10, warmup=1):
+    """
+    Calls function warmup times without measuring and then
+    repeat times with measuring. Returns a Benchmark.
+    """
+    for i in range(warmup):
+        function()
+    elapsed_times = []
+    for i in range(max(repeat, 1)):
+        start = _timer()
+        function()
+        elapsed_times.append(_timer() - start)
+    return Benchmark(elapsed_times)
@@ -0,0 +1,104 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import errno
+import socket
+
+from pikzie.core import TestRunnerContext
+from pikzie.tester import Tester
+from pikzie.ui.console import ConsoleTestRunner
+from pikzie.parallel import replay_events
+from pikzie.server import default_path, read_frame, _check_peer
+
+__all__ = ["run"]
+
+_console_options = ["use_color", "verbose_level", "color_scheme", "slowest"]
+
+def run(args, path=None, output=sys.stdout):
+    """
+    Asks pikzie.server listening on path to run tests with args
+    that are the same as the command line options of Tester.
+    Results are shown by a ConsoleTestRunner in the current
+    process. Returns the exit status.
+    """
+    args = list(args)
+    options = Tester()._parse(args)[0].__dict__
+    if options["base_dir"] is None:
+        args[0:0] = ["--base-dir", os.getcwd()]
+    path = path or default_path()
+    if os.stat(path).st_uid != os.getuid():
+        raise socket.error(errno.EACCES, "owned by another user", path)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        return communicate(connection, args, output,
+                           **dict([(name, options[name])
+                                   for name in _console_options]))
+    finally:
+        connection.close()
+
+def communicate(connection, args, output=sys.stdout, **console_options):
+    """
+    Sends a request of args on connection and shows its results.
+    socket.error is raised if the server is ran by another user.
+    """
+    _check_peer(connection)
+    request = {"args": args, "cwd": os.getcwd()}
+    connection.sendall((json.dumps(request) + "\n").encode("utf-8"))
+    runner = ConsoleTestRunner(output, **console_options)
+    context = TestRunnerContext()
+    context.add_listener(runner)
+    input = connection.makefile("rb")
+    tests = []
+    test_case = None
+    try:
+        while True:
+            frame = read_frame(input)
+            if frame is None:
+                return 2
+            name = frame[0]
+            if name == "output":
+                runner._flush()
+                output.write(frame[1])
+            elif name == "test":
+                tests.append(frame[1])
+            elif name == "test_case":
+                test_case = type(frame[1], (object,), {"__doc__": frame[2]})
+            elif name == "event":
+                replay_events(context, test_case, tests, [frame[1]])
+            elif name == "status":
+                return frame[1] or 0
+    finally:
+        runner._flush()
+        input.close()
+
+def main(args=None):
+    Tester.ran = True
+    if args is None:
+        args = sys.argv[1:]
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        return 1
+    except socket.error:
+        sys.stderr.write("failed to connect to pikzie server: %s: %s\n" %
+                         (default_path(), sys.exc_info()[1]))
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,19 +15,33 @@
 
 import re
 import sys
-import traceback
+import linecache
 import os
-import errno
 import fnmatch
 import types
 import time
-import tempfile
+import inspect
+try:
+    from inspect import isawaitable, iscoroutinefunction
+except ImportError:
+    def isawaitable(object):
+        return False
+    def iscoroutinefunction(object):
+        return False
 
 from pikzie.color import *
 from pikzie.results import *
 from pikzie.assertions import Assertions
 from pikzie.decorators import metadata
 from pikzie.priority import PriorityChecker
+from pikzie.result_store import LogResultStore
+import pikzie.history
+import pikzie.shard
+import pikzie.discovery
+import pikzie.benchmarking
+import pikzie.fixtures
+import pikzie.impact
+from pikzie.retention import CompactResult, FaultSpool
 
 __all__ = ["TestSuite", "TestCase", "TestRunnerContext", "TestLoader"]
 
@@ -65,13 +79,27 @@ class TestSuite(object):
             if context.need_interrupt():
                 break
         context.on_finish_test_suite(self)
+        TestCase.result_store.flush(compact=True)
+
+_timer = getattr(time, "perf_counter", time.time)
 
 class TracebackEntry(object):
-    def __init__(self, file_name, line_number, name, content):
+    """
+    An entry of a traceback. If content is None, it's read from
+    the source file when it's needed.
+    """
+    def __init__(self, file_name, line_number, name, content=None):
         self.file_name = file_name
         self.line_number = line_number
         self.name = name
-        self.content = content
+        self._content = content
+
+    def content(self):
+        if self._content is None:
+            self._content = linecache.getline(self.file_name,
+                                              self.line_number).strip()
+        return self._content
+    content = property(content)
 
     def __str__(self):
         result = '%s:%d: %s()' % (self.file_name, self.line_number, self.name)
@@ -107,10 +135,12 @@ class OmissionTestError(Exception):
         return self.message
 
 class TestCaseRunner(object):
-    def __init__(self, test_case, tests, priority_mode=True):
+    def __init__(self, test_case, tests, priority_mode=True,
+                 async_concurrency=None):
         self.test_case = test_case
         self._tests = tests
         self.priority_mode = priority_mode
+        self.async_concurrency = async_concurrency
 
     def tests(self):
         tests = self._tests
@@ -124,11 +154,96 @@ class TestCaseRunner(object):
             return
 
         context.on_start_test_case(self.test_case)
-        for test in tests:
-            test.run(context)
+        try:
+            if self._setup_test_case(context, tests):
+                torn_down = []
+                def teardown_test_case():
+                    torn_down.append(True)
+                    return self.test_case._call_teardown_test_case()
+                try:
+                    if self.async_concurrency and self.async_concurrency > 1:
+                        self._run_concurrently(context, tests,
+                                               teardown_test_case)
+                    else:
+                        for test in tests[:-1]:
+                            test.run(context)
+                        tests[-1].run(context, teardown_test_case)
+                finally:
+                    if not torn_down:
+                        self._teardown_test_case(context, tests)
+        finally:
+            context.close_event_loop()
         context.on_finish_test_case(self.test_case)
 
+    def _setup_test_case(self, context, tests):
+        """
+        Calls setup_test_case of the test case. If it raises an
+        exception, all tests are reported with the exception
+        without running them.
+        """
+        try:
+            self._wait(context, self.test_case._call_setup_test_case())
+            return True
+        except KeyboardInterrupt:
+            context.interrupt()
+        except:
+            exc_info = sys.exc_info()
+            for test in tests:
+                test._abort(context, exc_info)
+        return False
+
+    def _teardown_test_case(self, context, tests):
+        """
+        Calls teardown_test_case of the test case when the last
+        test couldn't call it. An exception raised by it is
+        reported as a result of the last test.
+        """
+        try:
+            self._wait(context, self.test_case._call_teardown_test_case())
+        except KeyboardInterrupt:
+            context.interrupt()
+        except:
+            last_test = tests[-1]
+            last_test._report_fault(context, sys.exc_info())
+            last_test.result_store.update(last_test.id(), passed=False)
+
+    def _wait(self, context, result):
+        if isawaitable(result):
+            return context.run_until_complete(result)
+        return result
+
+    def _run_concurrently(self, context, tests, teardown_test_case):
+        import pikzie.asynchronous
+        async_tests = [test for test in tests if test.is_concurrent_async()]
+        for test in tests:
+            if test.is_concurrent_async():
+                continue
+            if async_tests or test is not tests[-1]:
+                test.run(context)
+            else:
+                test.run(context, teardown_test_case)
+        pikzie.asynchronous.run_concurrently(context, self.test_case,
+                                             async_tests,
+                                             self.async_concurrency,
+                                             teardown_test_case)
+
 class TestCaseTemplate(object):
+    def setup_test_case(cls):
+        """
+        Hook method for setting up the fixture shared by all tests
+        in the test case. It's called only once before the first test.
+        """
+        pass
+    setup_test_case = classmethod(setup_test_case)
+
+    def teardown_test_case(cls):
+        """
+        Hook method for deconstructing the fixture shared by all tests
+        in the test case. It's called only once after the last test.
+        """
+        pass
+    teardown_test_case = classmethod(teardown_test_case)
+
     def setup(self):
         "Hook method for setting up the test fixture before exercising it."
         pass
@@ -149,14 +264,23 @@ class TestCase(TestCaseTemplate, Assertions):
     Test authors should subclass TestCase for their own tests. Construction
     and deconstruction of the test's environment ('fixture') can be
     implemented by overriding the 'setup' and 'teardown' methods respectively.
+    A fixture that is expensive to create can be shared by all tests of
+    the class by overriding the 'setup_test_case' and 'teardown_test_case'
+    class methods and storing it as a class attribute.
 
     If it is necessary to override the __init__ method, the base class
     __init__ method must always be called. It is important that subclasses
     should not change the signature of their __init__ method, since instances
     of the classes are instantiated automatically by parts of the framework
     in order to be run.
+
+    Whether each test is passed or not is recorded to
+    result_store to select tests in priority mode. Replace it
+    with another ResultStore to change where results are stored.
     """
 
+    result_store = LogResultStore()
+
     def _collect_test(cls, target, base_n_args):
         def is_function(object):
             return ((hasattr(object, "__code__") and
@@ -264,31 +388,49 @@ class TestCase(TestCaseTemplate, Assertions):
             (str(self.__class__), self.__method_name, self.__description,
              self.__data_label, str(self.__data))
 
+    def is_async(self):
+        "Returns True if the test method is a coroutine function."
+        return iscoroutinefunction(self._test_method())
+
+    concurrent_async = True
+    def is_concurrent_async(self):
+        """
+        Returns True if the test can be ran concurrently with other
+        async tests of the same test case.
+        """
+        return (self.concurrent_async and self.is_async() and
+                self.get_metadata("benchmark") is None)
+
     def need_to_run(self):
         return not self._is_previous_test_success() or \
             self._need_to_run_according_to_priority()
 
-    def run(self, context):
+    def run(self, context, teardown_test_case=None):
+        """
+        Runs the test. teardown_test_case is called after the
+        teardown of the last test in the test case so that its
+        error is reported as a result of the test.
+        """
         success = False
         try:
             self._started(context)
 
             try:
                 try:
-                    self._run_setup(context)
+                    self._run_phase(context, "setup", self._run_setup)
                 except PendingTestError:
                     self._pend_test(context)
                 except OmissionTestError:
                     self._omit_test(context)
                 except KeyboardInterrupt:
-                    context.interrupted()
+                    context.interrupt()
                     return
                 except:
                     self._add_error(context)
                     return
 
                 try:
-                    self._run_test(context)
+                    self._run_phase(context, "test", self._run_test)
                     success = True
                 except AssertionFailure:
                     self._add_failure(context)
@@ -297,38 +439,108 @@ class TestCase(TestCaseTemplate, Assertions):
                 except OmissionTestError:
                     self._omit_test(context)
                 except KeyboardInterrupt:
-                    context.interrupted()
+                    context.interrupt()
                     return
                 except:
                     self._add_error(context)
             finally:
                 try:
-                    self._run_teardown(context)
+                    self._run_phase(context, "teardown", self._run_teardown)
                 except PendingTestError:
                     self._pend_test(context)
                 except OmissionTestError:
                     self._omit_test(context)
                 except KeyboardInterrupt:
-                    context.interrupted()
+                    context.interrupt()
                 except:
                     self._add_error(context)
                     success = False
 
         finally:
+            if teardown_test_case is not None:
+                if not self._run_teardown_test_case(context,
+                                                    teardown_test_case):
+                    success = False
             self._finished(success, context)
 
+    def _run_teardown_test_case(self, context, teardown_test_case):
+        "Returns False if teardown_test_case raises an exception."
+        try:
+            self._wait(context, teardown_test_case())
+        except KeyboardInterrupt:
+            context.interrupt()
+        except:
+            self._report_fault(context, sys.exc_info())
+            return False
+        return True
+
+    def _run_phase(self, context, phase, run):
+        context.on_start_phase(self, phase)
+        try:
+            run(context)
+        finally:
+            context.on_finish_phase(self, phase)
+
     def _run_setup(self, context):
-        self.setup()
+        self._prepare_fixtures(context)
+        self._wait(context, self._call_setup())
+
+    def _prepare_fixtures(self, context):
+        for name in self.get_metadata("fixtures") or []:
+            context.fixtures.get(name)
+
+    def fixture(self, name):
+        """
+        Returns the fixture named name. It's built at the first
+        use in the test run.
+        """
+        return self.__context.fixtures.get(name)
 
     def _run_test(self, context):
+        options = self.get_metadata("benchmark")
+        if options is None:
+            self._wait(context, self._call_test())
+        else:
+            self._run_benchmark(context, options)
+
+    benchmark = None
+    def _run_benchmark(self, context, options):
+        def run():
+            self._wait(context, self._call_test())
+        self.benchmark = pikzie.benchmarking.measure(run, options["repeat"],
+                                                     options["warmup"])
+        self.benchmark.update_baseline(self.result_store, self.id())
+        if self.benchmark.is_regressed(options["max_regression"]):
+            self._fail("benchmark regressed: %s" % self.benchmark)
+
+    def _run_teardown(self, context):
+        self._wait(context, self._call_teardown())
+
+    def _call_setup_test_case(cls):
+        return cls.setup_test_case()
+    _call_setup_test_case = classmethod(_call_setup_test_case)
+
+    def _call_teardown_test_case(cls):
+        return cls.teardown_test_case()
+    _call_teardown_test_case = classmethod(_call_teardown_test_case)
+
+    def _call_setup(self):
+        return self.setup()
+
+    def _call_test(self):
         test_method = self._test_method()
         if self.__data_label:
-            test_method(self.__data)
+            return test_method(self.__data)
         else:
-            test_method()
+            return test_method()
 
-    def _run_teardown(self, context):
-        self.teardown()
+    def _call_teardown(self):
+        return self.teardown()
+
+    def _wait(self, context, result):
+        if isawaitable(result):
+            return context.run_until_complete(result)
+        return result
 
     def _method_name(self):
         return self.__method_name
@@ -357,20 +569,37 @@ class TestCase(TestCaseTemplate, Assertions):
         notification = Notification(self, message, traceback)
         self.__context.add_notification(self, notification)
 
+    def _abort(self, context, exc_info):
+        "Reports the given exception as the result without running test."
+        self._started(context)
+        try:
+            self._report_fault(context, exc_info)
+        finally:
+            self._finished(False, context)
+
+    def _report_fault(self, context, exc_info):
+        exception = exc_info[1]
+        if isinstance(exception, PendingTestError):
+            self._pend_test(context, exc_info)
+        elif isinstance(exception, OmissionTestError):
+            self._omit_test(context, exc_info)
+        else:
+            self._add_error(context, exc_info)
+
     def _started(self, context):
         self.__context = context
         context.on_start_test(self)
-        if os.path.exists(self._passed_file()):
-            os.remove(self._passed_file())
 
     def _finished(self, success, context):
+        success = success and not context.is_test_faulted()
         if success:
             self._add_success(context)
         context.on_finish_test(self)
+        self.result_store.update(self.id(), passed=success,
+                                 elapsed=context.last_test_elapsed)
         self.__context = None
 
     def _add_success(self, context):
-        open(self._passed_file(), "w").close()
         context.add_success(self)
 
     def _add_failure(self, context):
@@ -381,20 +610,20 @@ class TestCase(TestCaseTemplate, Assertions):
                           assertion_failure.actual)
         context.add_failure(self, failure)
 
-    def _add_error(self, context):
-        exception_type, message, traceback = sys.exc_info()
+    def _add_error(self, context, exc_info=None):
+        exception_type, message, traceback = exc_info or sys.exc_info()
         traceback = self._prepare_traceback(traceback, False)
         error = Error(self, exception_type, message, traceback)
         context.add_error(self, error)
 
-    def _pend_test(self, context):
-        exception_type, message, traceback = sys.exc_info()
+    def _pend_test(self, context, exc_info=None):
+        exception_type, message, traceback = exc_info or sys.exc_info()
         traceback = self._prepare_traceback(traceback, True)
         pending = Pending(self, message, traceback)
         context.pend_test(self, pending)
 
-    def _omit_test(self, context):
-        exception_type, message, traceback = sys.exc_info()
+    def _omit_test(self, context, exc_info=None):
+        exception_type, message, traceback = exc_info or sys.exc_info()
         traceback = self._prepare_traceback(traceback, True)
         omission = Omission(self, message, traceback)
         context.omit_test(self, omission)
@@ -405,8 +634,13 @@ class TestCase(TestCaseTemplate, Assertions):
         length = None
         if tb and compute_length:
             length = self._count_relevant_frame_levels(tb.tb_frame)
-        stack_infos = traceback.extract_tb(tb, length)
-        return self._create_traceback_entries(stack_infos)
+        entries = []
+        while tb and (length is None or len(entries) < length):
+            code = tb.tb_frame.f_code
+            entries.append(TracebackEntry(code.co_filename, tb.tb_lineno,
+                                          code.co_name))
+            tb = tb.tb_next
+        return entries
 
     def _prepare_frame(self, frame, compute_length):
         while frame and self._is_relevant_frame_level(frame):
@@ -414,18 +648,35 @@ class TestCase(TestCaseTemplate, Assertions):
         length = None
         if compute_length:
             length = self._count_relevant_frame_levels(frame)
-        stack_infos = traceback.extract_stack(frame, length)
-        return self._create_traceback_entries(stack_infos)
-
-    def _create_traceback_entries(self, stack_infos):
         entries = []
-        for stack_info in stack_infos:
-            filename, lineno, name, line = stack_info
-            entries.append(TracebackEntry(filename, lineno, name, line))
+        while frame and (length is None or len(entries) < length):
+            code = frame.f_code
+            entries.append(TracebackEntry(code.co_filename, frame.f_lineno,
+                                          code.co_name))
+            frame = frame.f_back
+        entries.reverse()
         return entries
 
+    _relevant_codes = {}
+    _relevant_codes_size = 4096
     def _is_relevant_frame_level(self, frame):
-        globals = frame.f_globals
+        """
+        Returns True if frame is in Pikzie. The result is cached
+        per code object. The cache is cleared when it has
+        _relevant_codes_size code objects.
+        """
+        code = frame.f_code
+        relevant = self._relevant_codes.get(code)
+        if relevant is None:
+            relevant = self._is_relevant_globals(frame.f_globals)
+            if len(self._relevant_codes) >= self._relevant_codes_size:
+                self._relevant_codes.clear()
+            self._relevant_codes[code] = relevant
+        return relevant
+
+    def _is_relevant_globals(self, globals):
+        if globals.get("__name__", "").startswith("asyncio."):
+            return True
         for cls in (TestCase,) + TestCase.__bases__:
             name = cls.__name__
             if name in globals and globals[name] == cls:
@@ -440,34 +691,7 @@ class TestCase(TestCaseTemplate, Assertions):
         return length
 
     def _is_previous_test_success(self):
-        return os.path.exists(self._passed_file())
-
-    def _passed_file(self):
-        return os.path.join(self._result_dir(), "passed")
-
-    def _result_dir(self):
-        components = [".test-result", self._test_case_name(), self.short_name()]
-        parent_directories = [os.path.dirname(sys.argv[0]),
-                              os.getcwd(),
-                              os.path.join(os.path.dirname(__file__), "..")]
-        if hasattr(os, "getuid"):
-            parent_directories.append([os.path.join(tempfile.gettempdir(),
-                                                    str(os.getuid()))])
-        else:
-            parent_directories.append([os.path.join(tempfile.gettempdir(),
-                                                    str(os.getpid()))])
-        for parent_directory in parent_directories:
-            dir = os.path.abspath(os.path.join(parent_directory, *components))
-            if os.path.isdir(dir):
-                return dir
-            try:
-                os.makedirs(dir)
-                return dir
-            except OSError:
-                pass
-
-        raise OSError(errno.EACCES, "Permission denied",
-                      ", ".join(parent_directories))
+        return self.result_store.get(self.id(), "passed", False)
 
     default_priority = "normal"
     def _need_to_run_according_to_priority(self):
@@ -486,7 +710,10 @@ class TestLoader(object):
 
     def __init__(self, base_dir=None, pattern=None, ignore_dirs=None,
                  test_names=None, test_case_names=None,
-                 target_modules=None, priority_mode=True):
+                 target_modules=None, priority_mode=True,
+                 async_concurrency=None, shard=None, discovery_cache=None,
+                 static_discovery=False, changed_files=None, impact_map=None,
+                 shard_durations=None):
         self.base_dir = base_dir
         self.pattern = pattern
         self.ignore_dirs = ignore_dirs
@@ -494,6 +721,14 @@ class TestLoader(object):
         self.test_case_names = test_case_names
         self.target_modules = target_modules or []
         self.priority_mode = priority_mode
+        self.async_concurrency = async_concurrency
+        self.shard = shard
+        self.shard_durations = shard_durations
+        self.discovery_cache = discovery_cache
+        self.static_discovery = static_discovery
+        self.changed_files = changed_files
+        self.impact_map = impact_map
+        self._selected_test_ids = None
 
     def _get_test_names(self):
         return self._test_names
@@ -526,49 +761,155 @@ class TestLoader(object):
     def collect_test_cases(self, files=[]):
         test_cases = []
         for module in self._load_modules(files):
-            for test_case_collector in self.test_case_collectors:
-                test_cases.extend(test_case_collector(self, module))
+            test_cases.extend(self._collect_test_cases_from_module(module))
 
         def is_target_test_case_name(test_case):
-            name = test_case.__name__
-            if self.test_case_names is None:
-                return True
-            def is_target_name(test_case_name):
-                if type(test_case_name) == str:
-                    return test_case_name == name
-                else:
-                    return test_case_name.search(name)
-            return len(list(filter(is_target_name, self.test_case_names))) > 0
-
+            return self._is_target_test_case_name(test_case.__name__)
         return list(filter(is_target_test_case_name, test_cases))
 
+    def _collect_test_cases_from_module(self, module):
+        test_cases = []
+        for test_case_collector in self.test_case_collectors:
+            test_cases.extend(test_case_collector(self, module))
+        return test_cases
+
     def create_test_suite(self, files=[]):
-        tests = []
+        """
+        Creates a TestSuite of target tests in files. If
+        changed_files is a list of paths, only tests affected by
+        them in impact_map are included. If shard is (I, N), only
+        tests in the I-th shard of N shards are included. Tests
+        are assigned to shards by their IDs. If shard_durations
+        is a result store, shards are balanced by elapsed times
+        in it instead. All shards must use the same store.
+        """
+        tests_of_test_cases = []
         for test_case in self.collect_test_cases(files):
             def _is_target_test(test):
                 return self._is_target_test(test)
             target_tests = filter(_is_target_test, test_case.collect_test())
-            target_tests = list(target_tests)
+            tests_of_test_cases.append((test_case, list(target_tests)))
+        if self.shard or self.changed_files is not None:
+            if self._selected_test_ids is None:
+                if self.changed_files is not None:
+                    tests_of_test_cases = \
+                        self._select_affected(tests_of_test_cases)
+                if self.shard:
+                    tests_of_test_cases = \
+                        self._select_shard(tests_of_test_cases)
+            else:
+                tests_of_test_cases = [
+                    (test_case,
+                     [test for test in tests
+                      if test.id() in self._selected_test_ids])
+                    for test_case, tests in tests_of_test_cases]
+
+        tests = []
+        for test_case, target_tests in tests_of_test_cases:
             if len(target_tests) > 0:
                 tests.append(TestCaseRunner(test_case, target_tests,
-                                            self.priority_mode))
+                                            self.priority_mode,
+                                            self.async_concurrency))
+        self._check_fixtures(tests)
         return TestSuite(tests)
 
+    def _check_fixtures(self, runners):
+        """
+        Checks fixtures used by tests are defined without circular
+        dependency. They aren't built here.
+        """
+        names = []
+        for runner in runners:
+            for test in runner._tests:
+                names.extend(test.get_metadata("fixtures") or [])
+        pikzie.fixtures.registry.resolve(names)
+
+    def list_test_ids(self, files=[]):
+        """
+        Returns IDs of target tests. Test files aren't imported if
+        their tests are found by discovery_cache or static_discovery.
+        """
+        if self._use_inventories() and len(self.target_modules) == 0:
+            base_dir, targets = self._targets(files)
+            self._enter_base_dir(base_dir)
+            try:
+                inventories, modules = self._collect_inventories(base_dir,
+                                                                 targets)
+            finally:
+                self._leave_base_dir(base_dir)
+            if self.discovery_cache is not None:
+                self.discovery_cache.save()
+            return [test_id for target, test_id
+                    in self._select_tests_in_inventories(base_dir,
+                                                         inventories)]
+        test_ids = []
+        for runner in self.create_test_suite(files):
+            test_ids.extend([test.id() for test in runner._tests])
+        return test_ids
+
+    def _select_affected(self, tests_of_test_cases):
+        def is_affected(test):
+            try:
+                path = inspect.getsourcefile(test._test_method())
+            except TypeError:
+                path = None
+            return self._is_affected(test.id(), path)
+        return [(test_case, list(filter(is_affected, tests)))
+                for test_case, tests in tests_of_test_cases]
+
+    def _is_affected(self, test_id, path):
+        if self.impact_map is None:
+            self.impact_map = pikzie.impact.ImpactMap()
+        return self.impact_map.is_affected(test_id, set(self.changed_files),
+                                           [path])
+
+    def _select_shard(self, tests_of_test_cases):
+        all_tests = []
+        for test_case, tests in tests_of_test_cases:
+            all_tests.extend(tests)
+        selected_test_ids = self._select_shard_ids([test.id()
+                                                    for test in all_tests])
+        return [(test_case,
+                 [test for test in tests if test.id() in selected_test_ids])
+                for test_case, tests in tests_of_test_cases]
+
+    def _select_shard_ids(self, test_ids):
+        durations = None
+        if self.shard_durations is not None:
+            durations = pikzie.history.estimate_id_durations(
+                test_ids, self.shard_durations)
+        index, count = self.shard
+        shards = pikzie.shard.assign_shards(test_ids, count, durations)
+        return set([test_id
+                    for test_id, shard in zip(test_ids, shards)
+                    if shard == index])
+
     def _find_targets(self):
-        targets = []
         base_dir = os.path.abspath(self.base_dir or self.default_base_dir)
         pattern = self.pattern or self.default_pattern
         ignore_dirs = (self.ignore_dirs or []) + self.default_ignore_dirs
+        if self.discovery_cache is not None:
+            targets = self.discovery_cache.targets(base_dir, pattern,
+                                                   ignore_dirs)
+            if targets is not None:
+                return (base_dir, targets)
+
+        targets = []
+        directories = []
         for root, dirs, files in os.walk(base_dir):
+            directories.append(root)
             for file in files:
                 if fnmatch.fnmatch(file, pattern):
                     targets.append(re.sub("^\./", "", os.path.join(root, file)))
             for ignore_dir in ignore_dirs:
                 if ignore_dir in dirs:
                     dirs.remove(ignore_dir)
-        return (base_dir,
-                map(lambda path: re.sub("^%s\/" % re.escape(base_dir), "", path),
-                    targets))
+        targets = [re.sub("^%s\/" % re.escape(base_dir), "", path)
+                   for path in targets]
+        if self.discovery_cache is not None:
+            self.discovery_cache.store_targets(base_dir, pattern, ignore_dirs,
+                                               directories, targets)
+        return (base_dir, targets)
 
     def _need_load_files(self, files, modules):
         if self.pattern is not None:
@@ -577,34 +918,152 @@ class TestLoader(object):
             return True
         return False
 
-    def _load_modules(self, files=[]):
-        modules = self.target_modules[:]
+    def _targets(self, files):
         targets = files[:]
         base_dir = None
-        if self._need_load_files(files, modules):
+        if self._need_load_files(files, self.target_modules):
             base_dir, _targets = self._find_targets()
             targets += _targets
+        return base_dir, targets
+
+    def _enter_base_dir(self, base_dir):
         if base_dir:
-            base_dir = os.path.abspath(base_dir)
             sys.path.insert(0, base_dir)
-        for target in targets:
-            target = os.path.splitext(target)[0]
-            target = re.sub(re.escape(os.path.sep), ".", target)
-            parts = target.split(".")
-            module = None
-            while len(parts) > 0 and module is None:
-                name = ".".join(parts)
-                __import__(name)
-                module = sys.modules[name]
-                parts.pop()
-            if module is not None and module not in modules:
-                modules.append(module)
+
+    def _leave_base_dir(self, base_dir):
         if base_dir:
             sys.path.remove(base_dir)
+
+    def _load_modules(self, files=[]):
+        modules = self.target_modules[:]
+        base_dir, targets = self._targets(files)
+        self._enter_base_dir(base_dir)
+        try:
+            loaded_modules = {}
+            self._selected_test_ids = None
+            if self._use_inventories():
+                inventories, loaded_modules = \
+                    self._collect_inventories(base_dir, targets)
+                selected_tests = self._select_tests_in_inventories(
+                    base_dir, inventories)
+                self._selected_test_ids = set([test_id for target, test_id
+                                               in selected_tests])
+                selected_targets = set([target for target, test_id
+                                        in selected_tests])
+                targets = [target for target in targets
+                           if (target in selected_targets or
+                               target in loaded_modules)]
+            for target in targets:
+                if target in loaded_modules:
+                    module = loaded_modules[target]
+                else:
+                    module = self._load_module(target)
+                    self._store_inventory(base_dir, target, module)
+                if module is not None and module not in modules:
+                    modules.append(module)
+        finally:
+            self._leave_base_dir(base_dir)
+        if self.discovery_cache is not None:
+            self.discovery_cache.save()
         return modules
 
+    def _module_name(self, target):
+        target = os.path.splitext(target)[0]
+        return re.sub(re.escape(os.path.sep), ".", target)
+
+    def _load_module(self, target):
+        parts = self._module_name(target).split(".")
+        module = None
+        while len(parts) > 0 and module is None:
+            name = ".".join(parts)
+            __import__(name)
+            module = sys.modules[name]
+            parts.pop()
+        return module
+
+    def _target_path(self, base_dir, target):
+        return os.path.join(base_dir or "", target)
+
+    def _use_inventories(self):
+        return self.discovery_cache is not None or self.static_discovery
+
+    def _collect_inventories(self, base_dir, targets):
+        """
+        Returns a list of (target, inventory) and a dictionary of
+        modules that are imported to collect their inventories.
+        A test file is imported only when its inventory isn't
+        in discovery_cache and can't be found by static_discovery.
+        """
+        inventories = []
+        loaded_modules = {}
+        for target in targets:
+            path = self._target_path(base_dir, target)
+            inventory = None
+            if self.discovery_cache is not None:
+                inventory = self.discovery_cache.inventory(path)
+            if inventory is None and self.static_discovery:
+                inventory = pikzie.discovery.scan_source(
+                    path, self._module_name(target))
+                if inventory is not None and self.discovery_cache is not None:
+                    self.discovery_cache.store_inventory(path, inventory)
+            if inventory is None:
+                module = self._load_module(target)
+                loaded_modules[target] = module
+                inventory = self._store_inventory(base_dir, target, module)
+            inventories.append((target, inventory))
+        return inventories, loaded_modules
+
+    def _store_inventory(self, base_dir, target, module):
+        if module is None:
+            return []
+        inventory = self._inventory(module)
+        if self.discovery_cache is not None:
+            self.discovery_cache.store_inventory(
+                self._target_path(base_dir, target), inventory)
+        return inventory
+
+    def _inventory(self, module):
+        inventory = []
+        for test_case in self._collect_test_cases_from_module(module):
+            tests = []
+            for test in test_case.collect_test():
+                if not test.short_name().startswith("test_"):
+                    continue
+                metadata = pikzie.discovery.normalize_metadata(test.metadata)
+                tests.append({"name": test.short_name(),
+                              "id": test.id(),
+                              "metadata": metadata})
+            inventory.append({"name": test_case.__name__, "tests": tests})
+        return inventory
+
+    def _select_tests_in_inventories(self, base_dir, inventories):
+        "Returns a list of (target, test ID) of target tests in inventories."
+        selected_tests = []
+        for target, inventory in inventories:
+            path = self._target_path(base_dir, target)
+            for test_case in inventory:
+                if not self._is_target_test_case_name(test_case["name"]):
+                    continue
+                for test in test_case["tests"]:
+                    if not self._is_target_test_name(test["name"]):
+                        continue
+                    if self.changed_files is not None and \
+                            not self._is_affected(test["id"], path):
+                        continue
+                    selected_tests.append((target, test["id"]))
+        if self.shard:
+            selected_test_ids = self._select_shard_ids([test_id
+                                                        for target, test_id
+                                                        in selected_tests])
+            selected_tests = [(target, test_id)
+                              for target, test_id in selected_tests
+                              if test_id in selected_test_ids]
+        return selected_tests
+
     def _is_target_test(self, test):
-        name = test.short_name()
+        return self._is_target_test_name(test.short_name())
+
+    def _is_target_test_name(self, name):
         if not name.startswith("test_"):
             return False
         if self.test_names is not None:
@@ -617,6 +1076,16 @@ class TestLoader(object):
                 return False
         return True
 
+    def _is_target_test_case_name(self, name):
+        if self.test_case_names is None:
+            return True
+        def is_target_name(test_case_name):
+            if type(test_case_name) == str:
+                return test_case_name == name
+            else:
+                return test_case_name.search(name)
+        return len(list(filter(is_target_name, self.test_case_names))) > 0
+
     def _prepare_target_names(self, names):
         if names is None: return names
         if type(names) == str:
@@ -643,14 +1112,48 @@ class TestRunnerContext(object):
     failures and errors that occurred among those test runs. The collections
     contain tuples of (testcase, exceptioninfo), where exceptioninfo is the
     formatted traceback of the error that occurred.
+
+    If retention is "compact", results are kept as CompactResults
+    that don't refer tests and faults are spilled to a temporary
+    file. Use iter_faults() to read them.
+
+    While events recorded in another process are replayed,
+    replaying is True, event_time is the time when the event
+    occurred and worker is the process ID that ran it.
+
+    concurrent is True for a context of a test that runs
+    concurrently with other tests in the same process.
     """
-    def __init__(self):
+    def __init__(self, retention=None):
+        self.retention = retention or "all"
         self.n_assertions = 0
         self.n_tests = 0
         self.results = []
         self.listeners = []
         self.interrupted = False
         self.elapsed = 0
+        self.last_test_elapsed = None
+        self.test_phases = {}
+        self.test_case_phases = {}
+        self.test_usage = {}
+        self.replaying = False
+        self.event_time = None
+        self.worker = None
+        self.concurrent = False
+        self._phase_start_at = {}
+        self._n_test_critical_faults = 0
+        self._n_results = {}
+        self._faults = []
+        self._faults_by_class = {}
+        self._fault_spool = None
+        if self.retention == "compact":
+            self._fault_spool = FaultSpool()
+        self._n_faults = 0
+        self._n_critical_faults = 0
+        self._callbacks = {}
+        self._n_resolved_listeners = 0
+        self._event_loop = None
+        self.fixtures = pikzie.fixtures.FixtureSet()
 
     def add_listener(self, listener):
         self.listeners.append(listener)
@@ -659,36 +1162,54 @@ class TestRunnerContext(object):
         self.listeners.extend(listeners)
 
     def faults(self):
-        return list(filter(lambda result: result.fault, self.results))
+        "Faults in reported order. Don't modify the returned list."
+        if self._fault_spool is not None:
+            return list(self._fault_spool)
+        return self._faults
     faults = property(faults)
 
+    def iter_faults(self):
+        """
+        Iterates faults in reported order. Spilled faults are
+        loaded one by one.
+        """
+        if self._fault_spool is not None:
+            return iter(self._fault_spool)
+        return iter(self._faults)
+
+    def faults_of(self, result_class):
+        """
+        Returns faults of result_class in reported order. This
+        is always empty if retention is "compact".
+        """
+        return self._faults_by_class.get(result_class, [])
+
     def n_faults(self):
-        return len(self.faults)
+        return self._n_faults
     n_faults = property(n_faults)
 
+    def n_results(self, result_class):
+        "Returns the number of results of result_class."
+        return self._n_results.get(result_class, 0)
+
     def n_failures(self):
-        return len(list(filter(lambda result: isinstance(result, Failure),
-                               self.results)))
+        return self.n_results(Failure)
     n_failures = property(n_failures)
 
     def n_errors(self):
-        return len(list(filter(lambda result: isinstance(result, Error),
-                               self.results)))
+        return self.n_results(Error)
     n_errors = property(n_errors)
 
     def n_pendings(self):
-        return len(list(filter(lambda result: isinstance(result, Pending),
-                               self.results)))
+        return self.n_results(Pending)
     n_pendings = property(n_pendings)
 
     def n_omissions(self):
-        return len(list(filter(lambda result: isinstance(result, Omission),
-                               self.results)))
+        return self.n_results(Omission)
     n_omissions = property(n_omissions)
 
     def n_notifications(self):
-        return len(list(filter(lambda result: isinstance(result, Notification),
-                               self.results)))
+        return self.n_results(Notification)
     n_notifications = property(n_notifications)
 
     def pass_assertion(self, test):
@@ -697,18 +1218,67 @@ class TestRunnerContext(object):
 
     def on_start_test(self, test):
         "Called when the given test is about to be run"
-        self._start_at = time.time()
+        self._start_at = _timer()
         self.n_tests += 1
+        self.test_phases = {}
+        self.test_usage = {}
+        self._n_test_critical_faults = 0
         self._notify("start_test", test)
 
-    def on_finish_test(self, test):
+    def is_test_faulted(self):
+        "Returns True if the current test has a failure or an error."
+        return self._n_test_critical_faults > 0
+
+    def on_finish_test(self, test, elapsed=None):
         "Called when the given test has been run"
-        self._finish_at = time.time()
-        self.elapsed += (self._finish_at - self._start_at)
+        self._finish_at = _timer()
+        if elapsed is None:
+            elapsed = self._finish_at - self._start_at
+        self.elapsed += elapsed
+        self.last_test_elapsed = elapsed
         self._notify("finish_test", test)
 
+    def on_start_phase(self, test, phase):
+        """
+        Called when the given phase ("setup", "test" or "teardown")
+        of the given test is about to be run
+        """
+        self._phase_start_at[phase] = _timer()
+        self._notify("start_phase", test, phase)
+
+    def on_finish_phase(self, test, phase, elapsed=None):
+        """
+        Called when the given phase of the given test has been
+        run. Elapsed times of phases are collected into
+        test_phases for the current test and test_case_phases
+        for the current test case.
+        """
+        if elapsed is None:
+            elapsed = _timer() - self._phase_start_at.pop(phase)
+        self.test_phases[phase] = elapsed
+        self.test_case_phases[phase] = \
+            self.test_case_phases.get(phase, 0) + elapsed
+        self._notify("finish_phase", test, phase)
+
+    def report_usage(self, test, usage):
+        """
+        Called when resource usage of the given test such as
+        CPU time is measured. It's collected into test_usage.
+        """
+        self.test_usage.update(usage)
+        self._notify("usage", test, usage)
+
+    def report_footprint(self, test, footprint):
+        """
+        Called when source files and functions executed by the
+        given test are recorded. footprint is a dictionary of a
+        path to a list of function names.
+        """
+        self._notify("footprint", test, footprint)
+
     def on_start_test_case(self, test_case):
         "Called when the given test case is about to be run"
+        self.test_case_phases = {}
         self._notify("start_test_case", test_case)
 
     def on_finish_test_case(self, test_case):
@@ -721,44 +1291,95 @@ class TestRunnerContext(object):
 
     def on_finish_test_suite(self, test_suite):
         "Called when the given test suite has been run"
+        self.fixtures.teardown()
         self._notify("finish_test_suite", test_suite)
 
     def add_error(self, test, error):
         """Called when an error has occurred."""
-        error.elapsed = time.time() - self._start_at
-        self.results.append(error)
-        self._notify("error", error)
+        self._prepare_result(test, error)
+        self.add_result(error)
 
     def add_failure(self, test, failure):
         """Called when a failure has occurred."""
-        failure.elapsed = time.time() - self._start_at
-        self.results.append(failure)
-        self._notify("failure", failure)
+        self._prepare_result(test, failure)
+        self.add_result(failure)
 
     def add_notification(self, test, notification):
         """Called when a notification has occurred."""
-        notification.elapsed = time.time() - self._start_at
-        self.results.append(notification)
-        self._notify("notification", notification)
+        self._prepare_result(test, notification)
+        self.add_result(notification)
 
     def add_success(self, test):
         "Called when a test has completed successfully"
         success = Success(test)
-        success.elapsed = time.time() - self._start_at
-        self.results.append(success)
-        self._notify("success", success)
+        self._prepare_result(test, success)
+        self.add_result(success)
 
     def pend_test(self, test, pending):
         """Called when a test is pended."""
-        pending.elapsed = time.time() - self._start_at
-        self.results.append(pending)
-        self._notify("pending", pending)
+        self._prepare_result(test, pending)
+        self.add_result(pending)
 
     def omit_test(self, test, omission):
         """Called when a test is omitted."""
-        omission.elapsed = time.time() - self._start_at
-        self.results.append(omission)
-        self._notify("omission", omission)
+        self._prepare_result(test, omission)
+        self.add_result(omission)
+
+    def _prepare_result(self, test, result):
+        result.elapsed = _timer() - self._start_at
+        result.phases = self.test_phases
+        result.usage = self.test_usage
+        result.benchmark = test.benchmark
+
+    def add_result(self, result):
+        """
+        Called when a result that already has its elapsed time is
+        reported. Results run in another process are reported by this.
+        """
+        self._count_result(result)
+        if self._fault_spool is None:
+            self._retain_result(result)
+        self._notify(result.name, result)
+        result.release()
+        if self._fault_spool is not None:
+            self._spill_result(result)
+
+    def _count_result(self, result):
+        for result_class in type(result).__mro__:
+            self._n_results[result_class] = \
+                self._n_results.get(result_class, 0) + 1
+        if result.fault:
+            self._n_faults += 1
+            if result.critical:
+                self._n_critical_faults += 1
+                self._n_test_critical_faults += 1
+
+    def _retain_result(self, result):
+        self.results.append(result)
+        if result.fault:
+            self._faults.append(result)
+            self._faults_by_class.setdefault(type(result), []).append(result)
+
+    def _spill_result(self, result):
+        self.results.append(CompactResult(result))
+        if result.fault:
+            self._fault_spool.append(result)
+
+    def run_until_complete(self, awaitable):
+        """
+        Runs awaitable on the event loop for tests and returns its
+        result. The event loop is created on the first call.
+        """
+        if self._event_loop is None:
+            import asyncio
+            self._event_loop = asyncio.new_event_loop()
+        return self._event_loop.run_until_complete(awaitable)
+
+    def close_event_loop(self):
+        "Closes the event loop for tests if it has been created."
+        if self._event_loop is not None:
+            self._event_loop.close()
+            self._event_loop = None
 
     def interrupt(self):
         "Indicates that the tests should be interrupted"
@@ -768,14 +1389,27 @@ class TestRunnerContext(object):
         return self.interrupted
 
     def succeeded(self):
-        return len(list(filter(lambda fault: fault.critical, self.faults))) == 0
+        return self._n_critical_faults == 0
     succeeded = property(succeeded)
 
     def _notify(self, name, *args):
+        if self._n_resolved_listeners != len(self.listeners):
+            self._callbacks = {}
+            self._n_resolved_listeners = len(self.listeners)
+        callbacks = self._callbacks.get(name)
+        if callbacks is None:
+            callbacks = self._resolve_callbacks(name)
+        for callback in callbacks:
+            callback(self, *args)
+
+    def _resolve_callbacks(self, name):
+        callback_name = "on_%s" % name
+        callbacks = []
         for listener in self.listeners:
-            callback_name = "on_%s" % name
             if hasattr(listener, callback_name):
-                getattr(listener, callback_name)(self, *args)
+                callbacks.append(getattr(listener, callback_name))
+        self._callbacks[name] = callbacks
+        return callbacks
 
     def summary(self):
         return ("%d test(s), %d assertion(s), %d failure(s), %d error(s), " \
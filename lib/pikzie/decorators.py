@@ -13,7 +13,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-__all__ = ["metadata", "bug", "priority", "data"]
+__all__ = ["metadata", "bug", "priority", "data", "benchmark", "uses"]
 
 def override_setter(container, name, value):
     container[name] = value
@@ -46,3 +46,22 @@ def priority(priority):
 def data(label, value):
     """Set test data."""
     return metadata("data", {"label": label, "value": value}, append_setter)
+
+def benchmark(repeat=10, warmup=1, max_regression=None):
+    """
+    Run test as a benchmark. The test is ran warmup times and
+    then measured repeat times. The test fails if the median
+    is larger than max_regression times of the baseline.
+    """
+    return metadata("benchmark", {"repeat": repeat,
+                                  "warmup": warmup,
+                                  "max_regression": max_regression})
+
+def uses(*names):
+    """
+    Set names of fixtures used by test. They are built before
+    setup of the test if they aren't built yet.
+    """
+    def setter(container, name, value):
+        container[name] = container.get(name, []) + list(value)
+    return metadata("fixtures", names, setter)
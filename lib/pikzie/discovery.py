@@ -0,0 +1,374 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import ast
+import json
+
+from pikzie.result_store import result_directory
+
+__all__ = ["DiscoveryCache", "normalize_metadata", "scan_source"]
+
+def normalize_metadata(metadata):
+    "Returns metadata without test data as a JSON compatible dictionary."
+    if not metadata:
+        return {}
+    normalized_metadata = {}
+    for name in metadata:
+        if name == "data":
+            continue
+        value = metadata[name]
+        if not isinstance(value, (str, int, float, bool, type(None))):
+            value = repr(value)
+        normalized_metadata[name] = value
+    return normalized_metadata
+
+class _DynamicSource(Exception):
+    "Raised when tests in a source can't be found without importing it."
+
+_metadata_decorators = {
+    "bug": "bug",
+    "priority": "priority",
+}
+
+def scan_source(path, module_name):
+    """
+    Returns an inventory of tests in the test file at path by
+    parsing it without importing. The inventory format is the
+    same as DiscoveryCache's one. None is returned if the file
+    may define tests dynamically, e.g. tests are defined in a
+    loop, inherited from a class in other module or decorated
+    by an unknown decorator.
+    """
+    try:
+        input = open(path)
+        try:
+            tree = ast.parse(input.read(), path)
+        finally:
+            input.close()
+    except (IOError, SyntaxError, ValueError):
+        return None
+    try:
+        return _SourceScanner(module_name).scan(tree)
+    except _DynamicSource:
+        return None
+
+class _SourceScanner(object):
+    def __init__(self, module_name):
+        self.module_name = module_name
+        self.pikzie_imported = False
+        self.test_cases = {}
+        self.test_case_names = []
+        self.functions = {}
+
+    def scan(self, tree):
+        for node in tree.body:
+            self._scan_statement(node)
+        inventory = []
+        for name in self.test_case_names:
+            inventory.append({"name": name,
+                              "tests": self._tests("%s.%s" % (self.module_name,
+                                                              name),
+                                                   self.test_cases[name], 1)})
+        if self.pikzie_imported:
+            inventory.append({"name": self.module_name,
+                              "tests": self._tests(self.module_name,
+                                                   self.functions, 0)})
+        return inventory
+
+    def _scan_statement(self, node):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] == "pikzie":
+                    self.pikzie_imported = True
+        elif isinstance(node, ast.ImportFrom):
+            self._scan_import_from(node)
+        elif isinstance(node, (ast.FunctionDef, _AsyncFunctionDef)):
+            self.functions[node.name] = node
+        elif isinstance(node, ast.ClassDef):
+            self._scan_class(node)
+        elif isinstance(node, (ast.Assign, ast.AugAssign)):
+            targets = getattr(node, "targets", [getattr(node, "target", None)])
+            for target in targets:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        self._check_dynamic_name(name.id)
+        elif isinstance(node, ast.Expr):
+            pass
+        elif isinstance(node, ast.If) and self._is_main_guard(node):
+            pass
+        else:
+            for child in ast.walk(node):
+                if isinstance(child, (ast.FunctionDef, _AsyncFunctionDef,
+                                      ast.ClassDef, ast.Import,
+                                      ast.ImportFrom)):
+                    raise _DynamicSource()
+
+    def _scan_import_from(self, node):
+        module = node.module or ""
+        from_pikzie = module.split(".")[0] == "pikzie"
+        if from_pikzie:
+            return
+        for alias in node.names:
+            if alias.name == "*":
+                raise _DynamicSource()
+            self._check_dynamic_name(alias.asname or alias.name)
+
+    def _check_dynamic_name(self, name):
+        if name.startswith("test_") or name.startswith("Test"):
+            raise _DynamicSource()
+
+    def _scan_class(self, node):
+        methods = {}
+        is_test_case = False
+        for base in node.bases:
+            if self._is_test_case_base(base):
+                is_test_case = True
+            elif isinstance(base, ast.Name) and base.id in self.test_cases:
+                is_test_case = True
+                methods.update(self.test_cases[base.id])
+            elif isinstance(base, ast.Name) and base.id == "object":
+                pass
+            else:
+                raise _DynamicSource()
+        if not is_test_case:
+            self.test_cases.pop(node.name, None)
+            return
+        if node.decorator_list:
+            raise _DynamicSource()
+        for statement in node.body:
+            if isinstance(statement, (ast.FunctionDef, _AsyncFunctionDef)):
+                methods[statement.name] = statement
+            elif isinstance(statement, (ast.Assign, ast.AugAssign)):
+                targets = getattr(statement, "targets",
+                                  [getattr(statement, "target", None)])
+                for target in targets:
+                    for name in ast.walk(target):
+                        if (isinstance(name, ast.Name) and
+                            name.id.startswith("test_")):
+                            raise _DynamicSource()
+            elif isinstance(statement, (ast.Expr, ast.Pass, ast.ClassDef)):
+                pass
+            else:
+                raise _DynamicSource()
+        if node.name not in self.test_cases:
+            self.test_case_names.append(node.name)
+        self.test_cases[node.name] = methods
+
+    def _is_test_case_base(self, node):
+        if isinstance(node, ast.Name):
+            return node.id == "TestCase"
+        if isinstance(node, ast.Attribute):
+            return (node.attr == "TestCase" and
+                    isinstance(node.value, ast.Name) and
+                    node.value.id == "pikzie")
+        return False
+
+    def _is_main_guard(self, node):
+        test = node.test
+        return (isinstance(test, ast.Compare) and
+                isinstance(test.left, ast.Name) and
+                test.left.id == "__name__")
+
+    def _tests(self, test_case_id, functions, base_n_args):
+        tests = []
+        for name in sorted(functions):
+            if not name.startswith("test_"):
+                continue
+            function = functions[name]
+            n_args = (len(getattr(function.args, "posonlyargs", [])) +
+                      len(function.args.args))
+            metadata, data = self._decorators(function)
+            if data is None:
+                if n_args != base_n_args:
+                    continue
+                tests.append({"name": name,
+                              "id": "%s.%s" % (test_case_id, name),
+                              "metadata": metadata})
+            else:
+                if n_args != base_n_args + 1:
+                    continue
+                for label in data:
+                    short_name = "%s (%s)" % (name, label)
+                    tests.append({"name": short_name,
+                                  "id": "%s.%s" % (test_case_id, short_name),
+                                  "metadata": metadata})
+        return tests
+
+    def _decorators(self, function):
+        metadata = {}
+        data = None
+        for decorator in reversed(function.decorator_list):
+            if not isinstance(decorator, ast.Call) or decorator.keywords:
+                raise _DynamicSource()
+            name = self._decorator_name(decorator.func)
+            arguments = decorator.args
+            if name == "data" and len(arguments) == 2:
+                if data is None:
+                    data = []
+                data.append(self._literal(arguments[0]))
+            elif name in _metadata_decorators and len(arguments) == 1:
+                metadata[_metadata_decorators[name]] = \
+                    self._literal(arguments[0])
+            elif name == "metadata" and len(arguments) == 2:
+                metadata[self._literal(arguments[0])] = \
+                    self._literal(arguments[1])
+            else:
+                raise _DynamicSource()
+        return normalize_metadata(metadata), data
+
+    def _decorator_name(self, node):
+        if isinstance(node, ast.Name):
+            return node.id
+        if (isinstance(node, ast.Attribute) and
+            isinstance(node.value, ast.Name) and
+            node.value.id == "pikzie"):
+            return node.attr
+        raise _DynamicSource()
+
+    def _literal(self, node):
+        try:
+            return ast.literal_eval(node)
+        except ValueError:
+            raise _DynamicSource()
+
+_AsyncFunctionDef = getattr(ast, "AsyncFunctionDef", ast.FunctionDef)
+
+class DiscoveryCache(object):
+    """
+    A cache of test files and tests in them.
+
+    Test files found under a base directory are cached with
+    modification times of the walked directories. They are
+    reused while no directory is changed.
+
+    Tests in a test file are cached as an inventory that is a
+    list of test cases:
+
+      [{"name": TEST_CASE_NAME,
+        "tests": [{"name": SHORT_NAME, "id": ID, "metadata": {...}},
+                  ...]},
+       ...]
+
+    An inventory is reused while the modification time and the
+    size of the test file aren't changed.
+    """
+    file_name = "discovery.json"
+    version = 1
+
+    def __init__(self, path=None):
+        self._path = path
+        self._data = None
+        self._changed = False
+
+    def path(self):
+        if self._path is None:
+            self._path = os.path.join(result_directory(), self.file_name)
+        return self._path
+
+    def targets(self, base_dir, pattern, ignore_dirs):
+        "Returns cached test files or None if they may be changed."
+        key = self._targets_key(base_dir, pattern, ignore_dirs)
+        entry = self._ensure_data()["targets"].get(key)
+        if entry is None:
+            return None
+        for directory, mtime in entry["directories"].items():
+            try:
+                if os.stat(directory).st_mtime != mtime:
+                    return None
+            except OSError:
+                return None
+        return entry["files"]
+
+    def store_targets(self, base_dir, pattern, ignore_dirs, directories,
+                      files):
+        directory_mtimes = {}
+        for directory in directories:
+            try:
+                directory_mtimes[directory] = os.stat(directory).st_mtime
+            except OSError:
+                return
+        key = self._targets_key(base_dir, pattern, ignore_dirs)
+        self._ensure_data()["targets"][key] = {
+            "directories": directory_mtimes,
+            "files": list(files),
+        }
+        self._changed = True
+
+    def inventory(self, path):
+        "Returns the cached inventory of path or None if it may be changed."
+        path = os.path.abspath(path)
+        entry = self._ensure_data()["inventories"].get(path)
+        if entry is None:
+            return None
+        if entry["stat"] != self._stat(path):
+            return None
+        return entry["test_cases"]
+
+    def store_inventory(self, path, inventory):
+        path = os.path.abspath(path)
+        stat = self._stat(path)
+        if stat is None:
+            return
+        self._ensure_data()["inventories"][path] = {
+            "stat": stat,
+            "test_cases": inventory,
+        }
+        self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        path = self.path()
+        temporary_path = "%s.%d" % (path, os.getpid())
+        output = open(temporary_path, "w")
+        try:
+            json.dump(self._data, output, separators=(",", ":"))
+        finally:
+            output.close()
+        getattr(os, "replace", os.rename)(temporary_path, path)
+        self._changed = False
+
+    def _ensure_data(self):
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    def _load(self):
+        empty_data = {"version": self.version, "targets": {}, "inventories": {}}
+        try:
+            input = open(self.path())
+        except IOError:
+            return empty_data
+        try:
+            try:
+                data = json.load(input)
+            except ValueError:
+                return empty_data
+        finally:
+            input.close()
+        if not isinstance(data, dict) or data.get("version") != self.version:
+            return empty_data
+        return data
+
+    def _targets_key(self, base_dir, pattern, ignore_dirs):
+        return json.dumps([base_dir, pattern, sorted(ignore_dirs)])
+
+    def _stat(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_mtime, stat.st_size]
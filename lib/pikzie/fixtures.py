@@ -0,0 +1,140 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import warnings
+try:
+    from inspect import isgenerator
+except ImportError:
+    def isgenerator(object):
+        return hasattr(object, "next") and hasattr(object, "send")
+
+__all__ = ["fixture"]
+
+class FixtureError(Exception):
+    pass
+
+class Fixture(object):
+    def __init__(self, name, factory, depends):
+        self.name = name
+        self.factory = factory
+        self.depends = list(depends)
+
+class FixtureRegistry(object):
+    "Definitions of fixtures that can be used by tests by name."
+    def __init__(self):
+        self._fixtures = {}
+
+    def define(self, name, factory, depends=()):
+        self._fixtures[name] = Fixture(name, factory, depends)
+
+    def resolve(self, names):
+        """
+        Returns fixtures of names and fixtures they depend on.
+        Each fixture comes after its dependencies.
+        """
+        resolved = []
+        states = {}
+        def visit(name, path):
+            state = states.get(name)
+            if state == "resolved":
+                return
+            if state == "visiting":
+                raise FixtureError("circular fixture dependency: %s" %
+                                   " -> ".join(path + [name]))
+            fixture = self._fixtures.get(name)
+            if fixture is None:
+                if path:
+                    raise FixtureError("unknown fixture: %s (required by %s)" %
+                                       (name, path[-1]))
+                raise FixtureError("unknown fixture: %s" % name)
+            states[name] = "visiting"
+            for depend in fixture.depends:
+                visit(depend, path + [name])
+            states[name] = "resolved"
+            resolved.append(fixture)
+        for name in names:
+            visit(name, [])
+        return resolved
+
+registry = FixtureRegistry()
+
+def fixture(name=None, depends=()):
+    """
+    Define a fixture. The decorated function is called with
+    fixtures in depends when a test uses the fixture at the
+    first time. If the function is a generator, its first
+    value is the fixture and the rest is ran as its teardown.
+    """
+    def decorator(function):
+        registry.define(name or function.__name__, function, depends)
+        return function
+    return decorator
+
+class FixtureSet(object):
+    """
+    Fixtures that are built in a test run or a worker. Each
+    fixture is built only once and they are torn down in the
+    reverse order of building.
+    """
+    def __init__(self, registry=registry):
+        self.registry = registry
+        self._values = {}
+        self._errors = {}
+        self._teardowns = []
+
+    def get(self, name):
+        if name not in self._values:
+            for fixture in self.registry.resolve([name]):
+                if fixture.name not in self._values:
+                    self._build(fixture)
+        return self._values[name]
+
+    def _build(self, fixture):
+        error = self._errors.get(fixture.name)
+        if error:
+            raise FixtureError("fixture %s isn't available: %s" %
+                               (fixture.name, error))
+        values = [self._values[depend] for depend in fixture.depends]
+        try:
+            value = fixture.factory(*values)
+            if isgenerator(value):
+                generator = value
+                value = next(generator)
+                self._teardowns.append((fixture.name, generator))
+        except Exception:
+            exception = sys.exc_info()[1]
+            self._errors[fixture.name] = "%s: %s" % (type(exception).__name__,
+                                                     exception)
+            raise
+        self._values[fixture.name] = value
+
+    def teardown(self):
+        teardowns = self._teardowns
+        self._values = {}
+        self._errors = {}
+        self._teardowns = []
+        while teardowns:
+            name, generator = teardowns.pop()
+            try:
+                next(generator)
+            except StopIteration:
+                pass
+            except Exception:
+                exception = sys.exc_info()[1]
+                warnings.warn("failed to teardown fixture %s: %s: %s" %
+                              (name, type(exception).__name__, exception))
+            else:
+                warnings.warn("fixture %s yields more than one value" % name)
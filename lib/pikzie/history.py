@@ -0,0 +1,63 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ["test_duration", "estimate_durations", "estimate_id_durations",
+           "estimate_runner_durations"]
+
+def test_duration(test, default=None):
+    "Returns the elapsed time of test in the previous run."
+    return test.result_store.get(test.id(), "elapsed", default)
+
+def estimate_durations(tests):
+    """
+    Returns estimated elapsed times of tests in the same order
+    as tests. Tests that have never been ran are estimated as
+    the average of the other tests.
+    """
+    return _estimate([test_duration(test) for test in tests])
+
+def estimate_id_durations(test_ids, store):
+    """
+    Returns estimated elapsed times of tests identified by
+    test_ids with elapsed times recorded in store.
+    """
+    return _estimate([store.get(test_id, "elapsed") for test_id in test_ids])
+
+def _estimate(durations):
+    known_durations = [duration for duration in durations
+                       if duration is not None]
+    if len(known_durations) == 0:
+        default = 0.0
+    else:
+        default = sum(known_durations) / len(known_durations)
+    return [default if duration is None else duration
+            for duration in durations]
+
+def estimate_runner_durations(runners):
+    """
+    Returns estimated elapsed times of TestCaseRunners in the
+    same order as runners.
+    """
+    tests = []
+    for runner in runners:
+        tests.extend(runner._tests)
+    durations = estimate_durations(tests)
+    runner_durations = []
+    offset = 0
+    for runner in runners:
+        n_tests = len(runner._tests)
+        runner_durations.append(sum(durations[offset:offset + n_tests]))
+        offset += n_tests
+    return runner_durations
@@ -0,0 +1,262 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import sysconfig
+import threading
+
+from pikzie.result_store import result_directory
+
+__all__ = ["ImpactMap", "ImpactRecorder", "read_changed_files"]
+
+def read_changed_files(path):
+    """
+    Returns absolute paths of changed files listed in path one
+    per line such as the output of "git diff --name-only".
+    "-" reads them from the standard input.
+    """
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        input = open(path)
+        try:
+            lines = input.readlines()
+        finally:
+            input.close()
+    return [os.path.abspath(line.strip()) for line in lines if line.strip()]
+
+def _normalize_path(path):
+    if path.endswith(".pyc") or path.endswith(".pyo"):
+        path = path[:-1]
+    return os.path.abspath(path)
+
+class ImpactMap(object):
+    """
+    A map from test ID to its footprint that is source files
+    and functions executed by the test. A footprint is a
+    dictionary of an absolute path to a list of function names:
+
+      {PATH: [FUNCTION_NAME, ...], ...}
+
+    Paths are saved only once and referred by their index in
+    the file:
+
+      {"version": 1,
+       "files": [PATH, ...],
+       "tests": {ID: [[FILE_INDEX, [FUNCTION_NAME, ...]], ...], ...}}
+    """
+    file_name = "impact.json"
+    version = 1
+
+    def __init__(self, path=None):
+        self._path = path
+        self._footprints = None
+        self._changed = False
+
+    def path(self):
+        if self._path is None:
+            self._path = os.path.join(result_directory(), self.file_name)
+        return self._path
+
+    def footprint(self, test_id):
+        "Returns the footprint of test_id or None if it isn't recorded."
+        return self._ensure_footprints().get(test_id)
+
+    def store_footprint(self, test_id, footprint):
+        self._ensure_footprints()[test_id] = footprint
+        self._changed = True
+
+    def is_affected(self, test_id, changed_paths, own_paths=()):
+        """
+        Returns True if the test of test_id may be affected by
+        changed_paths: its footprint isn't recorded, one of
+        own_paths is changed or its footprint has a changed path.
+        """
+        for path in own_paths:
+            if path is not None and _normalize_path(path) in changed_paths:
+                return True
+        footprint = self.footprint(test_id)
+        if footprint is None:
+            return True
+        for path in footprint:
+            if path in changed_paths:
+                return True
+        return False
+
+    def save(self):
+        if not self._changed:
+            return
+        files = []
+        file_indexes = {}
+        tests = {}
+        for test_id, footprint in self._footprints.items():
+            entries = []
+            for path in sorted(footprint):
+                if path not in file_indexes:
+                    file_indexes[path] = len(files)
+                    files.append(path)
+                entries.append([file_indexes[path], footprint[path]])
+            tests[test_id] = entries
+        path = self.path()
+        temporary_path = "%s.%d" % (path, os.getpid())
+        output = open(temporary_path, "w")
+        try:
+            json.dump({"version": self.version, "files": files,
+                       "tests": tests},
+                      output, separators=(",", ":"))
+        finally:
+            output.close()
+        getattr(os, "replace", os.rename)(temporary_path, path)
+        self._changed = False
+
+    def _ensure_footprints(self):
+        if self._footprints is None:
+            self._footprints = self._load()
+        return self._footprints
+
+    def _load(self):
+        try:
+            input = open(self.path())
+        except IOError:
+            return {}
+        try:
+            try:
+                data = json.load(input)
+            except ValueError:
+                return {}
+        finally:
+            input.close()
+        if not isinstance(data, dict) or data.get("version") != self.version:
+            return {}
+        files = data["files"]
+        footprints = {}
+        for test_id, entries in data["tests"].items():
+            footprints[test_id] = dict([(files[index], functions)
+                                        for index, functions in entries])
+        return footprints
+
+def _library_directories():
+    directories = []
+    for name in ["stdlib", "platstdlib", "purelib", "platlib"]:
+        directory = sysconfig.get_paths().get(name)
+        if directory:
+            directories.append(os.path.join(os.path.abspath(directory), ""))
+    return tuple(directories)
+
+_own_path = _normalize_path(__file__)
+
+class ImpactRecorder(object):
+    """
+    A listener that records functions called by each test from
+    its setup to its teardown by sys.setprofile() and stores
+    them to impact_map when the test suite is finished.
+    Functions called by setup_test_case are recorded to all
+    tests in the test case and ones called by
+    teardown_test_case are recorded to the last test. Files in the
+    standard library and site-packages aren't recorded.
+
+    It can't be used with Profiler because both of them use the
+    profile function.
+    """
+    run_in_worker = True
+
+    def __init__(self, impact_map):
+        self.impact_map = impact_map
+        self._library_directories = _library_directories()
+        self._calls = None
+        self._running_tests = []
+        self._test_case_calls = None
+        self._test_case_tests = []
+        self._footprints = {}
+
+    def on_start_test_case(self, context, test_case):
+        if context.replaying:
+            return
+        self._calls = set()
+        self._running_tests = []
+        self._test_case_calls = set()
+        self._test_case_tests = []
+        calls = self._calls
+        def profile(frame, event, arg):
+            if event == "call":
+                code = frame.f_code
+                calls.add((code.co_filename,
+                           getattr(code, "co_qualname", code.co_name)))
+        sys.setprofile(profile)
+        threading.setprofile(profile)
+
+    def on_start_test(self, context, test):
+        if context.replaying or self._calls is None:
+            return
+        self._flush_calls()
+        self._running_tests.append((test, set()))
+        self._test_case_tests.append(test)
+
+    def on_finish_test(self, context, test):
+        if context.replaying or self._calls is None:
+            return
+        self._flush_calls()
+        for i, (running_test, calls) in enumerate(self._running_tests):
+            if running_test is test:
+                del self._running_tests[i]
+                context.report_footprint(test, self._footprint(calls))
+                break
+
+    def on_finish_test_case(self, context, test_case):
+        if context.replaying or self._calls is None:
+            return
+        sys.setprofile(None)
+        threading.setprofile(None)
+        self._flush_calls()
+        self._calls = None
+        if self._test_case_calls:
+            footprint = self._footprint(self._test_case_calls)
+            for test in self._test_case_tests:
+                context.report_footprint(test, footprint)
+        self._test_case_calls = None
+        self._test_case_tests = []
+
+    def on_footprint(self, context, test, footprint):
+        merged = self._footprints.setdefault(test.id(), {})
+        for path, functions in footprint.items():
+            merged[path] = sorted(set(merged.get(path, [])) | set(functions))
+
+    def on_finish_test_suite(self, context, test_suite):
+        for test_id, footprint in self._footprints.items():
+            self.impact_map.store_footprint(test_id, footprint)
+        self._footprints = {}
+        self.impact_map.save()
+
+    def _flush_calls(self):
+        if self._running_tests:
+            for test, calls in self._running_tests:
+                calls.update(self._calls)
+        else:
+            self._test_case_calls.update(self._calls)
+        self._calls.clear()
+
+    def _footprint(self, calls):
+        footprint = {}
+        for file_name, function in calls:
+            if file_name.startswith("<"):
+                continue
+            path = _normalize_path(file_name)
+            if path == _own_path or path.startswith(self._library_directories):
+                continue
+            footprint.setdefault(path, set()).add(function)
+        return dict([(path, sorted(functions))
+                     for path, functions in footprint.items()])
@@ -64,6 +64,7 @@ TestLoader.test_case_collectors.append(collect_test_case_from_module)
 
 class ModuleBasedTestCase(TestCase):
     __current_test_case__ = None
+    concurrent_async = False
 
     def collect_test(cls):
         return cls._collect_test(cls.target_module, 0)
@@ -84,15 +85,28 @@ class ModuleBasedTestCase(TestCase):
              self._method_name(), self.__description,
              self.__data_label, str(self.__data))
 
-    def _run_setup(self, context):
+    def _call_setup_test_case(cls):
+        setup_test_case = getattr(cls.target_module, "setup_test_case", None)
+        if setup_test_case:
+            return setup_test_case()
+    _call_setup_test_case = classmethod(_call_setup_test_case)
+
+    def _call_teardown_test_case(cls):
+        teardown_test_case = getattr(cls.target_module, "teardown_test_case",
+                                     None)
+        if teardown_test_case:
+            return teardown_test_case()
+    _call_teardown_test_case = classmethod(_call_teardown_test_case)
+
+    def _call_setup(self):
         setup = getattr(self.__class__.target_module, "setup", None)
         if setup:
-            setup()
+            return setup()
 
-    def _run_teardown(self, context):
+    def _call_teardown(self):
         teardown = getattr(self.__class__.target_module, "teardown", None)
         if teardown:
-            teardown()
+            return teardown()
 
     def _run_test(self, context):
         global __current_test_case__
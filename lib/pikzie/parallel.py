@@ -0,0 +1,277 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import gc
+import time
+try:
+    import multiprocessing
+    import multiprocessing.util
+except ImportError:
+    multiprocessing = None
+
+from pikzie.core import *
+from pikzie.core import TestCaseRunner
+import pikzie.history
+from pikzie.fixtures import FixtureSet
+from pikzie.retention import _portable
+
+__all__ = ["ParallelTestSuite", "EventRecorder", "replay_events"]
+
+class EventRecorder(object):
+    """
+    A listener that records events of tests as picklable tuples.
+
+    Tests are recorded as their index in the given tests. Each
+    event is recorded with the time when it occurred. The
+    recorded events can be replayed by replay_events() with the
+    same tests.
+    """
+    def __init__(self, tests):
+        self.events = []
+        self._indexes = {}
+        for i, test in enumerate(tests):
+            self._indexes[id(test)] = i
+
+    def _index(self, test):
+        return self._indexes[id(test)]
+
+    def _record(self, event):
+        self.events.append((time.time(), event))
+
+    def on_start_test_case(self, context, test_case):
+        self._record(("start_test_case",))
+
+    def on_finish_test_case(self, context, test_case):
+        self._record(("finish_test_case",))
+
+    def on_start_test(self, context, test):
+        self._record(("start_test", self._index(test)))
+
+    def on_pass_assertion(self, context, test):
+        self._record(("pass_assertion", self._index(test)))
+
+    def on_start_phase(self, context, test, phase):
+        self._record(("start_phase", self._index(test), phase))
+
+    def on_finish_phase(self, context, test, phase):
+        self._record(("finish_phase", self._index(test), phase,
+                            context.test_phases[phase]))
+
+    def on_finish_test(self, context, test):
+        self._record(("finish_test", self._index(test),
+                            context.last_test_elapsed))
+
+    def on_usage(self, context, test, usage):
+        self._record(("usage", self._index(test), usage))
+
+    def on_footprint(self, context, test, footprint):
+        self._record(("footprint", self._index(test), footprint))
+
+    def _on_result(self, context, result):
+        state = {}
+        for key, value in result.__dict__.items():
+            if key not in ("test", "phases", "usage"):
+                state[key] = _portable(value)
+        self._record(("result", self._index(result.test),
+                            result.__class__, state))
+
+    on_success = _on_result
+    on_failure = _on_result
+    on_error = _on_result
+    on_pending = _on_result
+    on_omission = _on_result
+    on_notification = _on_result
+
+def replay_events(context, test_case, tests, events, worker=None):
+    """
+    Reports events recorded by EventRecorder to context. While
+    an event is reported, context.event_time is the time when
+    the event occurred and context.worker is worker that ran
+    the event.
+    """
+    context.replaying = True
+    context.worker = worker
+    try:
+        _replay_events(context, test_case, tests, events)
+    finally:
+        context.replaying = False
+        context.worker = None
+        context.event_time = None
+
+def _replay_events(context, test_case, tests, events):
+    for event_time, event in events:
+        context.event_time = event_time
+        name = event[0]
+        if name == "start_test_suite":
+            context.on_start_test_suite(None)
+        elif name == "finish_test_suite":
+            context.on_finish_test_suite(None)
+        elif name == "start_test_case":
+            context.on_start_test_case(test_case)
+        elif name == "finish_test_case":
+            context.on_finish_test_case(test_case)
+        elif name == "start_test":
+            context.on_start_test(tests[event[1]])
+        elif name == "pass_assertion":
+            context.pass_assertion(tests[event[1]])
+        elif name == "start_phase":
+            context.on_start_phase(tests[event[1]], event[2])
+        elif name == "finish_phase":
+            context.on_finish_phase(tests[event[1]], event[2], event[3])
+        elif name == "finish_test":
+            context.on_finish_test(tests[event[1]], event[2])
+        elif name == "usage":
+            context.report_usage(tests[event[1]], event[2])
+        elif name == "footprint":
+            context.report_footprint(tests[event[1]], event[2])
+        elif name == "result":
+            index, result_class, state = event[1:]
+            result = result_class.__new__(result_class)
+            result.__dict__.update(state)
+            result.test = tests[index]
+            result.phases = context.test_phases
+            result.usage = context.test_usage
+            context.add_result(result)
+
+_worker_suite = None
+_worker_fixtures = None
+
+def _initialize_worker(suite):
+    global _worker_suite, _worker_fixtures
+    _worker_suite = suite
+    _worker_fixtures = FixtureSet()
+    multiprocessing.util.Finalize(_worker_fixtures, _worker_fixtures.teardown,
+                                  exitpriority=10)
+
+def _run_test_case_runner(index):
+    runner = _worker_suite._tests[index]
+    recorder = EventRecorder(runner._tests)
+    context = TestRunnerContext()
+    context.fixtures = _worker_fixtures
+    context.add_listeners(_worker_suite.worker_listeners)
+    context.add_listener(recorder)
+    runner.run(context)
+    TestCase.result_store.flush()
+    return index, os.getpid(), recorder.events
+
+class ParallelTestSuite(TestSuite):
+    """
+    A test suite that runs its TestCaseRunners in worker processes.
+
+    Workers are forked from the current process so that test
+    modules that are already loaded are shared with them. Objects
+    in the current process are frozen by gc.freeze() before
+    forking so that garbage collection in workers doesn't copy
+    pages of them. Workers take TestCaseRunners one by one from
+    a shared queue. Events
+    in workers are reported to the context of the current process
+    per TestCaseRunner. Listeners that have true run_in_worker
+    attribute are also added to contexts in workers. TestCaseRunners
+    that took longer in the previous runs are started earlier. If
+    fork isn't available or the current process is a worker, tests
+    are ran in the current process.
+    """
+    def __init__(self, tests=(), jobs=None):
+        TestSuite.__init__(self, tests)
+        self.worker_listeners = []
+        if not jobs:
+            jobs = self._default_jobs()
+        self.jobs = jobs
+
+    def run(self, context):
+        self.worker_listeners = [listener for listener in context.listeners
+                                 if getattr(listener, "run_in_worker", False)]
+        frozen = self._freeze()
+        try:
+            pool = self._create_pool()
+        finally:
+            if frozen:
+                gc.unfreeze()
+        if pool is None:
+            return TestSuite.run(self, context)
+
+        context.on_start_test_suite(self)
+        try:
+            self._run_in_pool(context, pool)
+        except:
+            pool.terminate()
+            pool.join()
+            raise
+        if context.need_interrupt():
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+        context.on_finish_test_suite(self)
+        TestCase.result_store.flush(compact=True)
+
+    def _freeze(self):
+        if self.jobs <= 1 or not hasattr(gc, "freeze"):
+            return False
+        if gc.get_freeze_count() > 0:
+            return False
+        gc.collect()
+        gc.freeze()
+        return True
+
+    def _run_in_pool(self, context, pool):
+        indexes = []
+        runners = []
+        for i, test in enumerate(self._tests):
+            if isinstance(test, TestCaseRunner):
+                indexes.append(i)
+                runners.append(test)
+            else:
+                test.run(context)
+                if context.need_interrupt():
+                    return
+        durations = pikzie.history.estimate_runner_durations(runners)
+        longest_first = sorted(zip(durations, indexes),
+                               key=lambda item: -item[0])
+        indexes = [index for duration, index in longest_first]
+        try:
+            results = pool.imap_unordered(_run_test_case_runner, indexes, 1)
+            for index, worker, events in results:
+                runner = self._tests[index]
+                replay_events(context, runner.test_case, runner._tests, events,
+                              worker)
+                if context.need_interrupt():
+                    break
+        except KeyboardInterrupt:
+            context.interrupt()
+
+    def _create_pool(self):
+        if self.jobs <= 1:
+            return None
+        if multiprocessing is None:
+            return None
+        if not hasattr(multiprocessing, "get_context"):
+            return None
+        if multiprocessing.current_process().daemon:
+            return None
+        try:
+            fork_context = multiprocessing.get_context("fork")
+        except ValueError:
+            return None
+        return fork_context.Pool(self.jobs, _initialize_worker, (self,))
+
+    def _default_jobs(self):
+        if multiprocessing is None:
+            return 1
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
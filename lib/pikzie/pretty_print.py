@@ -18,8 +18,186 @@ import types
 import difflib
 import pprint
 
+# Inputs that have more lines or characters than these limits are
+# compared by a linear-time line diff instead of difflib.ndiff.
+diff_line_limit = 2000
+diff_character_limit = 200000
+# The number of same lines around changed lines in a linear-time diff.
+diff_context = 3
+# The max number of lines of a diff.
+diff_output_limit = 1000
+# The max estimated cost of intraline hints by difflib.ndiff. It's
+# about the number of compared characters. A linear-time line diff is
+# used when this is exceeded. It takes about 1 second.
+diff_cost_limit = 8000000
+# The estimated cost of comparing a pair of lines besides their
+# characters.
+_diff_line_pair_cost = 30
+# The max number of cached diffs and the max total number of
+# characters of cached strings and diffs.
+diff_cache_size = 16
+diff_cache_character_limit = 1000000
+_diff_cache = {}
+_diff_cache_n_characters = [0]
+
+# Values that are larger than these limits are formatted with
+# their middle elided.
+format_depth_limit = 20
+format_length_limit = 1000
+format_string_limit = 10000
+format_byte_limit = 100000
+
 def format(object):
-    return pprint.pformat(object)
+    """
+    Formats object by pprint. Values deeper than
+    format_depth_limit, containers that have more than
+    format_length_limit items, strings that have more than
+    format_string_limit characters and the formatted result
+    that has more than format_byte_limit characters are elided.
+    """
+    if _is_small(object):
+        formatted_object = pprint.pformat(object)
+    else:
+        formatted_object = pprint.pformat(_elide(object, 0))
+    if len(formatted_object) > format_byte_limit:
+        half = format_byte_limit // 2
+        formatted_object = "%s\n...(%d characters)...\n%s" % \
+            (formatted_object[:half],
+             len(formatted_object) - half * 2,
+             formatted_object[-half:])
+    return formatted_object
+
+class LazyFormat(object):
+    """
+    A value that is formatted by format() when it's needed. The
+    raw value is dropped by release().
+    """
+    def __init__(self, object):
+        self._object = object
+        self._formatted_object = None
+
+    def release(self):
+        "Formats the raw value and drops it. Returns the formatted value."
+        if self._formatted_object is None:
+            self._formatted_object = format(self._object)
+            self._object = None
+        return self._formatted_object
+
+    __str__ = release
+
+    def __getstate__(self):
+        return {"_object": None, "_formatted_object": self.release()}
+
+_sequence_types = (list, tuple)
+_set_types = (set, frozenset)
+_string_types = [str, bytearray]
+try:
+    _string_types.append(bytes)
+except NameError:
+    pass
+try:
+    _string_types.append(unicode)
+except NameError:
+    pass
+_string_types = tuple(_string_types)
+
+def _is_small(object):
+    budget = [format_length_limit]
+    def consume(object, depth):
+        if depth > format_depth_limit:
+            return False
+        if isinstance(object, _string_types):
+            budget[0] -= len(object) // 100 + 1
+            return len(object) <= format_string_limit and budget[0] >= 0
+        budget[0] -= 1
+        if isinstance(object, dict):
+            for key, value in object.items():
+                if not consume(key, depth + 1): return False
+                if not consume(value, depth + 1): return False
+        elif isinstance(object, _sequence_types + _set_types):
+            for item in object:
+                if not consume(item, depth + 1): return False
+        return budget[0] >= 0
+    return consume(object, 0)
+
+class _Elided(object):
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return self.text
+
+class _ElidedKey(_Elided):
+    """
+    A key that is sorted between the first half and the last
+    half of keys of an elided dictionary by pprint.
+    """
+    def __init__(self, text, last_keys):
+        _Elided.__init__(self, text)
+        self._last_key_ids = set([id(key) for key in last_keys])
+
+    def __lt__(self, other):
+        return id(other) in self._last_key_ids
+
+    def __gt__(self, other):
+        return id(other) not in self._last_key_ids
+
+def _sort(items, key=lambda item: item):
+    # The same order as pprint.
+    safe_key = getattr(pprint, "_safe_key", None)
+    if safe_key is None:
+        return sorted(items, key=key)
+    return sorted(items, key=lambda item: safe_key(key(item)))
+
+def _elide(object, depth):
+    if isinstance(object, _string_types):
+        if len(object) <= format_string_limit:
+            return object
+        half = format_string_limit // 2
+        return _Elided("%r...(%d characters)...%r" % \
+                           (object[:half],
+                            len(object) - half * 2,
+                            object[-half:]))
+    if not isinstance(object, (dict,) + _sequence_types + _set_types):
+        return object
+    if depth >= format_depth_limit:
+        return _Elided("%s(...)" % type(object).__name__)
+
+    if isinstance(object, dict):
+        def elide_item(item):
+            key, value = item
+            return (_elide(key, depth + 1), _elide(value, depth + 1))
+        items = list(object.items())
+        if len(items) <= format_length_limit:
+            return dict([elide_item(item) for item in items])
+        # Elided items are sorted by pprint. The marker is sorted
+        # between the first half and the last half.
+        half = format_length_limit // 2
+        items = _sort(items, lambda item: item[0])
+        first_items = [elide_item(item) for item in items[:half]]
+        last_items = [elide_item(item) for item in items[-half:]]
+        marker = _ElidedKey("...(%d items)..." % (len(items) - half * 2),
+                            [key for key, value in last_items])
+        return dict(first_items + [(marker, _Elided("..."))] + last_items)
+
+    items = list(object)
+    if len(items) > format_length_limit:
+        half = format_length_limit // 2
+        if isinstance(object, _set_types):
+            items = _sort(items)
+        first_items = [_elide(item, depth + 1) for item in items[:half]]
+        last_items = [_elide(item, depth + 1) for item in items[-half:]]
+        marker = _ElidedKey("...(%d items)..." % (len(items) - half * 2),
+                            last_items)
+        items = first_items + [marker] + last_items
+    else:
+        items = [_elide(item, depth + 1) for item in items]
+    if isinstance(object, tuple):
+        return tuple(items)
+    elif isinstance(object, _set_types):
+        return set(items)
+    else:
+        return items
 
 _re_class = type(re.compile(""))
 def _re_flags(pattern):
@@ -92,19 +270,121 @@ def format_exception_class(exception_class):
         return format(exception_class)
 
 def format_for_diff(object):
+    if isinstance(object, LazyFormat):
+        object = object.release()
     if not isinstance(object, str):
         object = format(object)
     return object
 
 def format_diff(string1, string2):
+    """
+    Returns a diff of string1 and string2. Diffs are cached per
+    the pair of strings because a diff of the same values may be
+    needed more than once.
+    """
+    key = (string1, string2)
+    diff = _diff_cache.get(key)
+    if diff is None:
+        diff = _format_diff(string1, string2)
+        n_characters = len(string1) + len(string2) + len(diff)
+        if n_characters > diff_cache_character_limit:
+            return diff
+        if (len(_diff_cache) >= diff_cache_size or
+            _diff_cache_n_characters[0] + n_characters >
+            diff_cache_character_limit):
+            _diff_cache.clear()
+            _diff_cache_n_characters[0] = 0
+        _diff_cache[key] = diff
+        _diff_cache_n_characters[0] += n_characters
+    return diff
+
+def _format_diff(string1, string2):
     def ensure_newline(string):
         if string.endswith("\n"):
             return string
         else:
             return string + "\n"
-    diff = difflib.ndiff(ensure_newline(string1).splitlines(True),
-                         ensure_newline(string2).splitlines(True))
-    return "".join(diff).rstrip()
+    lines1 = ensure_newline(string1).splitlines(True)
+    lines2 = ensure_newline(string2).splitlines(True)
+    diff = None
+    if (len(lines1) + len(lines2) <= diff_line_limit and
+        len(string1) + len(string2) <= diff_character_limit):
+        diff = _ndiff(lines1, lines2)
+    if diff is None:
+        diff = _linear_diff(lines1, lines2)
+    return "".join(_truncate_diff(diff)).rstrip()
+
+def _ndiff(lines1, lines2):
+    """
+    Returns None if the estimated cost of intraline hints is
+    larger than diff_cost_limit. difflib.ndiff compares pairs
+    of lines in each replaced block character by character. It
+    compares up to n_lines1 * n_lines2 * min(n_lines1, n_lines2)
+    pairs in a block because it finds the most similar pair and
+    then compares lines before and after the pair again.
+    """
+    matcher = difflib.SequenceMatcher(None, lines1, lines2)
+    cost = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "replace":
+            continue
+        n_lines1 = i2 - i1
+        n_lines2 = j2 - j1
+        n_pairs = n_lines1 * n_lines2 * min(n_lines1, n_lines2)
+        n_characters1 = sum([len(line) for line in lines1[i1:i2]])
+        n_characters2 = sum([len(line) for line in lines2[j1:j2]])
+        cost += n_pairs * (_diff_line_pair_cost +
+                           (n_characters1 // n_lines1) *
+                           (n_characters2 // n_lines2))
+        if cost > diff_cost_limit:
+            return None
+    diff = []
+    for line in difflib.ndiff(lines1, lines2):
+        diff.append(line)
+        if len(diff) > diff_output_limit:
+            break
+    return diff
+
+def _linear_diff(lines1, lines2):
+    """
+    Returns a diff that shows lines between the common leading
+    lines and the common trailing lines as changed lines.
+    """
+    n_lines1 = len(lines1)
+    n_lines2 = len(lines2)
+    n_max_common_lines = min(n_lines1, n_lines2)
+    n_leading_lines = 0
+    while (n_leading_lines < n_max_common_lines and
+           lines1[n_leading_lines] == lines2[n_leading_lines]):
+        n_leading_lines += 1
+    n_trailing_lines = 0
+    while (n_trailing_lines < n_max_common_lines - n_leading_lines and
+           lines1[n_lines1 - n_trailing_lines - 1] ==
+           lines2[n_lines2 - n_trailing_lines - 1]):
+        n_trailing_lines += 1
+
+    diff = []
+    context_start = max(n_leading_lines - diff_context, 0)
+    if context_start > 0:
+        diff.append("  ... (%d same lines)\n" % context_start)
+    diff.extend(["  " + line
+                 for line in lines1[context_start:n_leading_lines]])
+    changed_lines1 = lines1[n_leading_lines:n_lines1 - n_trailing_lines]
+    changed_lines2 = lines2[n_leading_lines:n_lines2 - n_trailing_lines]
+    diff.extend(["- " + line for line in changed_lines1])
+    diff.extend(["+ " + line for line in changed_lines2])
+    context_end = n_lines1 - n_trailing_lines + min(n_trailing_lines,
+                                                    diff_context)
+    diff.extend(["  " + line
+                 for line in lines1[n_lines1 - n_trailing_lines:context_end]])
+    if context_end < n_lines1:
+        diff.append("  ... (%d same lines)\n" % (n_lines1 - context_end))
+    return diff
+
+def _truncate_diff(diff):
+    if len(diff) <= diff_output_limit:
+        return diff
+    return diff[:diff_output_limit] + ["... (truncated)\n"]
 
 def is_interested_diff(diff):
     if not diff:
@@ -0,0 +1,127 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+import sys
+import cProfile
+import pstats
+
+import pikzie.history
+from pikzie.results import Notification
+
+__all__ = ["Profiler"]
+
+def _file_name(name):
+    return re.sub(r"[^\w.-]+", "_", name) + ".pstats"
+
+def _merge(paths, output):
+    stats = pstats.Stats(*paths)
+    stats.dump_stats(output)
+    return stats
+
+class Profiler(object):
+    """
+    A listener that profiles each test by cProfile. Profiles
+    are saved to directory as tests/TEST_ID.pstats and they
+    are merged into test-cases/TEST_CASE.pstats per test case
+    and suite.pstats. The top functions by cumulative time in
+    the suite are printed when the suite is finished.
+
+    If threshold is specified, only tests that take threshold
+    seconds or more are saved. Tests that were faster than
+    threshold in the previous run aren't profiled.
+
+    Tests ran concurrently by async concurrency aren't profiled
+    because a profile can't separate them. They get a
+    notification instead.
+    """
+    run_in_worker = True
+
+    def __init__(self, directory, top=20, threshold=None, output=None):
+        self.directory = directory
+        self.top = top
+        self.threshold = threshold
+        self.output = output or sys.stdout
+        self._profile = None
+        self._profiled_test = None
+        self._test_paths = []
+        self._test_case_paths = []
+
+    def on_start_test_case(self, context, test_case):
+        self._test_paths = []
+
+    def on_start_test(self, context, test):
+        if context.replaying:
+            return
+        if context.concurrent:
+            message = "not profiled: ran concurrently with other tests"
+            context.add_notification(test, Notification(test, message, []))
+            return
+        if self._profile is not None:
+            return
+        if self.threshold is not None:
+            duration = pikzie.history.test_duration(test)
+            if duration is not None and duration < self.threshold:
+                return
+        self._profile = cProfile.Profile()
+        self._profiled_test = test
+        self._profile.enable()
+
+    def on_finish_test(self, context, test):
+        if test is not self._profiled_test:
+            return
+        profile = self._profile
+        profile.disable()
+        self._profile = None
+        self._profiled_test = None
+        if self.threshold is not None and \
+                context.last_test_elapsed < self.threshold:
+            return
+        path = os.path.join(self.directory, "tests", _file_name(test.id()))
+        self._prepare_directory(path)
+        profile.dump_stats(path)
+        self._test_paths.append(path)
+
+    def on_finish_test_case(self, context, test_case):
+        path = os.path.join(self.directory, "test-cases",
+                            _file_name("%s.%s" % (test_case.__module__,
+                                                  test_case.__name__)))
+        if context.replaying:
+            if os.path.exists(path):
+                self._test_case_paths.append(path)
+            return
+        if self._test_paths:
+            self._prepare_directory(path)
+            _merge(self._test_paths, path)
+            self._test_case_paths.append(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        self._test_paths = []
+
+    def on_finish_test_suite(self, context, test_suite):
+        if not self._test_case_paths:
+            return
+        stats = _merge(self._test_case_paths,
+                       os.path.join(self.directory, "suite.pstats"))
+        self._test_case_paths = []
+        stats.stream = self.output
+        stats.sort_stats("cumulative").print_stats(self.top)
+        self.output.flush()
+
+    def _prepare_directory(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
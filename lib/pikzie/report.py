@@ -13,15 +13,31 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import cgi
+import os
+import sys
+import json
+import time
+import threading
+import warnings
+from xml.sax.saxutils import escape
+from xml.etree import ElementTree
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pikzie.discovery import normalize_metadata
+
+_PHASES = ["setup", "test", "teardown"]
 
 class XML(object):
     def __init__(self, output):
         self.file = isinstance(output, str)
         if self.file:
-            output = file(output, "w")
+            output = open(output, "w")
         self.output = output
         self.have_test = False
+        self._results = []
 
     def on_start_test(self, report, test):
         if not self.have_test:
@@ -29,7 +45,15 @@ class XML(object):
             self._write("<report>\n")
 
     def _on_result(self, report, result):
-        self._write_result(result)
+        self._results.append(result)
+
+    def on_finish_test(self, report, test):
+        for result in self._results:
+            self._write_result(result)
+        self._results = []
+
+    def on_finish_test_case(self, report, test_case):
+        self.on_finish_test(report, None)
 
     on_success = _on_result
     on_failure = _on_result
@@ -60,7 +84,7 @@ class XML(object):
     def _write_tag(self, indent, name, content):
         if content:
             self._write("%s<%s>%s</%s>\n" % (indent, name,
-                                             cgi.escape(str(content)),
+                                             escape(str(content)),
                                              name))
         else:
             self._write("%s<%s/>\n" % (indent, name))
@@ -72,6 +96,9 @@ class XML(object):
         self._write_tag("    ", "status", result.name)
         self._write_tag("    ", "detail", result.detail())
         self._write_tag("    ", "elapsed", "%f" % result.elapsed)
+        self._write_phases(getattr(result, "phases", None))
+        self._write_usage(getattr(result, "usage", None))
+        self._write_benchmark(getattr(result, "benchmark", None))
         self._write_traceback(result.traceback)
         self._write("  </result>\n")
 
@@ -99,6 +126,42 @@ class XML(object):
             self._write_tag("        ", "value", metadata[key])
             self._write("      </option>\n")
 
+    def _write_phases(self, phases):
+        if not phases:
+            return
+        self._write("    <phases>\n")
+        for phase in _PHASES:
+            if phase not in phases:
+                continue
+            self._write("      <phase>\n")
+            self._write_tag("        ", "name", phase)
+            self._write_tag("        ", "elapsed", "%f" % phases[phase])
+            self._write("      </phase>\n")
+        self._write("    </phases>\n")
+
+    def _write_usage(self, usage):
+        if not usage:
+            return
+        self._write("    <usage>\n")
+        if "cpu_time" in usage:
+            self._write_tag("      ", "cpu_time", "%f" % usage["cpu_time"])
+        for name in ["rss_delta", "peak_memory"]:
+            if name in usage:
+                self._write_tag("      ", name, usage[name])
+        self._write("    </usage>\n")
+
+    def _write_benchmark(self, benchmark):
+        if benchmark is None:
+            return
+        self._write("    <benchmark>\n")
+        self._write_tag("      ", "runs", benchmark.runs)
+        self._write_tag("      ", "min", "%f" % benchmark.min)
+        self._write_tag("      ", "median", "%f" % benchmark.median)
+        self._write_tag("      ", "stddev", "%f" % benchmark.stddev)
+        if benchmark.baseline is not None:
+            self._write_tag("      ", "baseline", "%f" % benchmark.baseline)
+        self._write("    </benchmark>\n")
+
     def _write_traceback(self, traceback):
         if not traceback:
             return
@@ -110,3 +173,297 @@ class XML(object):
             self._write_tag("        ", "info", entry.content)
         self._write("      </entry>\n")
         self._write("    </backtrace>\n")
+
+class JSONLines(object):
+    """
+    A listener that writes a JSON object per result as a line.
+    Results are written when their test is finished so that they
+    have elapsed times of all phases.
+
+    Records are passed to a background thread through a queue
+    that has at most queue_size records. Tests are blocked only
+    when the queue is full.
+    """
+    queue_size = 1024
+
+    def __init__(self, output):
+        self.file = isinstance(output, str)
+        if self.file:
+            output = open(output, "w")
+        self.output = output
+        self._queue = queue.Queue(self.queue_size)
+        self._thread = None
+        self._results = []
+        self._error = None
+
+    def on_start_test_suite(self, context, test_suite):
+        self._start()
+
+    def _on_result(self, context, result):
+        if self._error is None:
+            self._results.append(result)
+
+    def on_finish_test(self, context, test):
+        self._start()
+        for result in self._results:
+            if self._error is not None:
+                break
+            self._queue.put(self._record(result))
+        self._results = []
+
+    def on_finish_test_case(self, context, test_case):
+        self.on_finish_test(context, None)
+
+    on_success = _on_result
+    on_failure = _on_result
+    on_error = _on_result
+    on_pending = _on_result
+    on_omission = _on_result
+    on_notification = _on_result
+
+    def on_finish_test_suite(self, context, test_suite):
+        try:
+            self.close()
+        except Exception:
+            exception = sys.exc_info()[1]
+            warnings.warn("failed to write JSON Lines report: %s: %s" %
+                          (type(exception).__name__, exception))
+
+    def close(self):
+        """
+        Writes all queued records and waits for the writer
+        thread. Raises the error that stopped writing if any.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self.file:
+            self.output.close()
+        elif self._error is None:
+            self.output.flush()
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._write_records)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _write_records(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            if self._error is not None:
+                # Records are dropped but the queue is still
+                # drained not to block reporting tests.
+                continue
+            try:
+                line = json.dumps(record, separators=(",", ":"), default=str)
+                self.output.write(line + "\n")
+            except Exception:
+                self._error = sys.exc_info()[1]
+
+    def _record(self, result):
+        test = result.test
+        record = {
+            "id": test.id(),
+            "test_case": test.__class__.__name__,
+            "test": test.short_name(),
+            "status": result.name,
+            "elapsed": result.elapsed,
+            "phases": dict(getattr(result, "phases", {})),
+            "metadata": normalize_metadata(test.metadata),
+        }
+        detail = result.detail()
+        if detail:
+            record["detail"] = str(detail)
+        if result.traceback:
+            record["traceback"] = [[entry.file_name,
+                                    entry.line_number,
+                                    entry.content]
+                                   for entry in result.traceback]
+        usage = getattr(result, "usage", None)
+        if usage:
+            record["usage"] = dict(usage)
+        benchmark = getattr(result, "benchmark", None)
+        if benchmark is not None:
+            record["benchmark"] = {"runs": benchmark.runs,
+                                   "min": benchmark.min,
+                                   "median": benchmark.median,
+                                   "stddev": benchmark.stddev,
+                                   "baseline": benchmark.baseline}
+        return record
+
+class TraceEvents(object):
+    """
+    A listener that writes spans of the test suite, test cases,
+    tests, their phases and bursts of assertions as a JSON array
+    of the Trace Event Format. It can be loaded by trace viewers
+    such as chrome://tracing and Perfetto. Tests ran in each
+    worker process are shown in their own track.
+
+    Assertions that are passed within burst_gap seconds of each
+    other are written as one span.
+    """
+    burst_gap = 0.001
+
+    def __init__(self, output):
+        self.file = isinstance(output, str)
+        if self.file:
+            output = open(output, "w")
+        self.output = output
+        self._pid = os.getpid()
+        self._origin = None
+        self._n_events = 0
+        self._tracks = {}
+        self._bursts = {}
+
+    def on_start_test_suite(self, context, test_suite):
+        self._span(context, "B", "suite", "suite")
+
+    def on_finish_test_suite(self, context, test_suite):
+        self._span(context, "E", "suite", "suite")
+        self.close()
+
+    def on_start_test_case(self, context, test_case):
+        self._span(context, "B", test_case.__name__, "test_case")
+
+    def on_finish_test_case(self, context, test_case):
+        self._span(context, "E", test_case.__name__, "test_case")
+
+    def on_start_test(self, context, test):
+        self._span(context, "B", str(test), "test", {"id": test.id()})
+
+    def on_finish_test(self, context, test):
+        self._flush_burst(context)
+        self._span(context, "E", str(test), "test")
+
+    def on_start_phase(self, context, test, phase):
+        self._span(context, "B", phase, "phase")
+
+    def on_finish_phase(self, context, test, phase):
+        self._flush_burst(context)
+        self._span(context, "E", phase, "phase")
+
+    def on_pass_assertion(self, context, test):
+        now = self._time(context)
+        track = self._track(context)
+        burst = self._bursts.get(track)
+        if burst is not None and now - burst[1] <= self.burst_gap:
+            burst[1] = now
+            burst[2] += 1
+        else:
+            self._flush_burst(context)
+            self._bursts[track] = [now, now, 1]
+
+    def close(self):
+        if self._n_events > 0:
+            self.output.write("\n]\n")
+        if self.file:
+            self.output.close()
+        else:
+            self.output.flush()
+
+    def _time(self, context):
+        if context.event_time is not None:
+            return context.event_time
+        return time.time()
+
+    def _track(self, context):
+        return context.worker or self._pid
+
+    def _timestamp(self, time):
+        if self._origin is None:
+            self._origin = time
+        return int((time - self._origin) * 1000000)
+
+    def _span(self, context, phase, name, category, args=None):
+        event = {"ph": phase,
+                 "name": name,
+                 "cat": category,
+                 "ts": self._timestamp(self._time(context))}
+        if args:
+            event["args"] = args
+        self._write_event(context, event)
+
+    def _flush_burst(self, context):
+        burst = self._bursts.pop(self._track(context), None)
+        if burst is None:
+            return
+        start, last, n_assertions = burst
+        start = self._timestamp(start)
+        self._write_event(context,
+                          {"ph": "X",
+                           "name": "assertions",
+                           "cat": "assertion",
+                           "ts": start,
+                           "dur": max(self._timestamp(last) - start, 1),
+                           "args": {"count": n_assertions}})
+
+    def _write_event(self, context, event):
+        track = self._track(context)
+        if track not in self._tracks:
+            if track == self._pid:
+                name = "main"
+            else:
+                name = "worker %d" % track
+            self._tracks[track] = name
+            self._write_event(context, {"ph": "M",
+                                        "name": "thread_name",
+                                        "args": {"name": name}})
+        event["pid"] = self._pid
+        event["tid"] = track
+        if self._n_events == 0:
+            self.output.write("[\n")
+        else:
+            self.output.write(",\n")
+        self.output.write(json.dumps(event, sort_keys=True))
+        self._n_events += 1
+
+def merge_xml_reports(inputs, output):
+    """
+    Merges XML reports written by XML into output. inputs are
+    file names. output is a file name or a file object. This
+    is for merging reports of shards that are ran separately.
+    """
+    results = []
+    for input in inputs:
+        for result in ElementTree.parse(input).getroot().findall("result"):
+            result.tail = None
+            results.append("  %s\n" % ElementTree.tostring(result,
+                                                           encoding="unicode"))
+
+    close = isinstance(output, str)
+    if close:
+        output = open(output, "w")
+    try:
+        if results:
+            output.write("<report>\n")
+            output.write("".join(results))
+            output.write("</report>\n")
+        else:
+            output.write("<report/>\n")
+    finally:
+        if close:
+            output.close()
+
+def main(args=None):
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog OUTPUT INPUT...",
+                          description="Merge XML reports into OUTPUT")
+    options, args = parser.parse_args(args)
+    if len(args) < 2:
+        parser.error("OUTPUT and INPUT are required")
+    merge_xml_reports(args[1:], args[0])
+    return 0
+
+if __name__ == "__main__":
+    import pikzie.tester
+    pikzie.tester.Tester.ran = True
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+import errno
+import json
+import tempfile
+
+__all__ = ["ResultStore", "LogResultStore", "result_directory"]
+
+use_script_directory = True
+
+def result_directory():
+    """
+    Returns a directory to store test results. The first
+    writable .test-result directory is used. The directory of
+    the running script isn't used if use_script_directory is
+    false such as in pikzie.server.
+    """
+    parent_directories = [os.getcwd(),
+                          os.path.join(os.path.dirname(__file__), "..")]
+    if use_script_directory:
+        parent_directories.insert(0, os.path.dirname(sys.argv[0]))
+    if hasattr(os, "getuid"):
+        parent_directories.append(os.path.join(tempfile.gettempdir(),
+                                               str(os.getuid())))
+    else:
+        parent_directories.append(os.path.join(tempfile.gettempdir(),
+                                               str(os.getpid())))
+    for parent_directory in parent_directories:
+        dir = os.path.abspath(os.path.join(parent_directory, ".test-result"))
+        if os.path.isdir(dir) and os.access(dir, os.W_OK):
+            return dir
+        try:
+            os.makedirs(dir)
+            return dir
+        except OSError:
+            pass
+
+    raise OSError(errno.EACCES, "Permission denied",
+                  ", ".join(parent_directories))
+
+class ResultStore(object):
+    """
+    A store of values recorded for each test across test runs.
+
+    Values are keyed by test ID (TestCase.id()) and value
+    name. This store keeps values only in memory. Subclasses
+    persist them by overriding _load() and flush().
+    """
+    def __init__(self):
+        self._entries = None
+        self._changes = []
+
+    def get(self, id, name, default=None):
+        return self._ensure_entries().get(id, {}).get(name, default)
+
+    def update(self, id, **values):
+        entry = self._ensure_entries().setdefault(id, {})
+        changed_values = {}
+        for name in values:
+            if entry.get(name) != values[name]:
+                changed_values[name] = values[name]
+        if changed_values:
+            entry.update(changed_values)
+            self._changes.append((id, changed_values))
+
+    def flush(self, compact=False):
+        self._changes = []
+
+    def _ensure_entries(self):
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def _load(self):
+        return {}
+
+class LogResultStore(ResultStore):
+    """
+    A result store that persists values into an append-only
+    log. Each line in the log is a JSON array of a test ID and
+    changed values.
+
+    Changes are appended only when flush() is called. The log
+    is rewritten with only the latest values when flush() is
+    called with compact=True and the log has many stale lines
+    including lines appended by other processes.
+    """
+    file_name = "results.log"
+
+    def __init__(self, path=None):
+        ResultStore.__init__(self)
+        self._path = path
+        self._n_lines = 0
+
+    def path(self):
+        if self._path is None:
+            self._path = os.path.join(result_directory(), self.file_name)
+        return self._path
+
+    def flush(self, compact=False):
+        if self._changes:
+            output = open(self.path(), "a")
+            try:
+                output.write("".join([self._format(id, values)
+                                      for id, values in self._changes]))
+            finally:
+                output.close()
+            self._n_lines += len(self._changes)
+            self._changes = []
+        if compact:
+            # Other processes such as workers of --jobs may have
+            # appended to the log.
+            self._entries = self._load()
+            if self._need_compact():
+                self._compact()
+
+    def _load(self):
+        entries = {}
+        self._n_lines = 0
+        try:
+            input = open(self.path())
+        except IOError:
+            return entries
+        try:
+            for line in input:
+                try:
+                    id, values = json.loads(line)
+                except ValueError:
+                    continue
+                entries.setdefault(id, {}).update(values)
+                self._n_lines += 1
+        finally:
+            input.close()
+        return entries
+
+    def _need_compact(self):
+        entries = self._ensure_entries()
+        return self._n_lines > len(entries) * 2
+
+    def _compact(self):
+        entries = self._ensure_entries()
+        path = self.path()
+        temporary_path = "%s.%d" % (path, os.getpid())
+        output = open(temporary_path, "w")
+        try:
+            for id in sorted(entries):
+                output.write(self._format(id, entries[id]))
+        finally:
+            output.close()
+        getattr(os, "replace", os.rename)(temporary_path, path)
+        self._entries = entries
+        self._n_lines = len(entries)
+
+    def _format(self, id, values):
+        return json.dumps([id, values], separators=(",", ":")) + "\n"
@@ -30,7 +30,9 @@ def format_metadata(metadata, need_newline=False):
     return result
 
 class TestResult(object):
-    pass
+    def release(self):
+        "Called when all listeners are notified of the result."
+        pass
 
 class Success(TestResult):
     name = "success"
@@ -118,6 +120,13 @@ class Failure(TestResult):
     def detail(self):
         return self.message
 
+    def release(self):
+        "Replaces lazily formatted values with the formatted strings."
+        if hasattr(self.expected, "release"):
+            self.expected = self.expected.release()
+        if hasattr(self.actual, "release"):
+            self.actual = self.actual.release()
+
 class Error(TestResult):
     name = "error"
 
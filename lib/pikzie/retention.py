@@ -0,0 +1,125 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pickle
+import tempfile
+
+__all__ = ["CompactResult", "TestSnapshot", "FaultSpool"]
+
+def _portable(value):
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return str(value)
+
+class CompactResult(object):
+    "A result without its test and details."
+    __slots__ = ["name", "test_id", "elapsed", "fault", "critical"]
+
+    def __init__(self, result):
+        self.name = result.name
+        self.test_id = result.test.id()
+        self.elapsed = getattr(result, "elapsed", None)
+        self.fault = result.fault
+        self.critical = result.critical
+
+class TestSnapshot(object):
+    """
+    A picklable copy of a test that has information to report
+    a fault of the test.
+    """
+    __slots__ = ["_id", "_name", "_short_name", "_description",
+                 "_data_label_value", "_data_value", "metadata"]
+
+    def __init__(self, test):
+        self._id = test.id()
+        self._name = str(test)
+        self._short_name = test.short_name()
+        self._description = test.description()
+        self._data_label_value = test._data_label()
+        self._data_value = _portable(test._data())
+        metadata = test.metadata
+        if metadata is not None:
+            metadata = dict([(key, _portable(value))
+                             for key, value in metadata.items()])
+        self.metadata = metadata
+
+    def __getstate__(self):
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            setattr(self, name, state[name])
+
+    def id(self):
+        return self._id
+
+    def short_name(self):
+        return self._short_name
+
+    def description(self):
+        return self._description
+
+    def _data_label(self):
+        return self._data_label_value
+
+    def _data(self):
+        return self._data_value
+
+    def __str__(self):
+        return self._name
+
+class FaultSpool(object):
+    """
+    Faults that are pickled into a temporary file. Faults are
+    loaded one by one by iteration.
+    """
+    def __init__(self):
+        self._file = None
+        self.size = 0
+
+    def append(self, fault):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        state = {}
+        for key, value in fault.__dict__.items():
+            if key == "test":
+                value = TestSnapshot(value)
+            else:
+                value = _portable(value)
+            state[key] = value
+        pickle.dump((fault.__class__, state), self._file,
+                    pickle.HIGHEST_PROTOCOL)
+        self.size += 1
+
+    def __iter__(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        self._file.seek(0)
+        try:
+            for i in range(self.size):
+                fault_class, state = pickle.load(self._file)
+                fault = fault_class.__new__(fault_class)
+                fault.__dict__.update(state)
+                yield fault
+        finally:
+            self._file.seek(0, 2)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
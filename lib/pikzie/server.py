@@ -0,0 +1,397 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import stat
+import json
+import time
+import errno
+import socket
+import struct
+import tempfile
+import traceback
+from optparse import OptionParser
+try:
+    from importlib import reload as _reload
+except ImportError:
+    _reload = reload
+
+from pikzie.core import TestCase, TracebackEntry
+from pikzie.tester import Tester
+from pikzie.parallel import EventRecorder
+from pikzie.retention import TestSnapshot
+from pikzie.results import Success, FAULT_ORDER
+from pikzie.result_store import LogResultStore
+import pikzie.result_store
+
+__all__ = ["TestServer", "default_path"]
+
+def _runtime_directory():
+    """
+    Returns $XDG_RUNTIME_DIR or pikzie-UID in the temporary
+    directory that only the current user can access.
+    """
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if directory:
+        return directory
+    return os.path.join(tempfile.gettempdir(), "pikzie-%d" % os.getuid())
+
+def default_path():
+    "Returns the path of the socket used when no path is specified."
+    path = os.environ.get("PIKZIE_SOCKET")
+    if path:
+        return path
+    return os.path.join(_runtime_directory(), "pikzie.sock")
+
+def _prepare_private_directory(directory):
+    """
+    Creates directory that only the current user can access if
+    it doesn't exist. OSError is raised if it's accessible by
+    other users.
+    """
+    try:
+        os.mkdir(directory, int("700", 8))
+    except OSError:
+        if sys.exc_info()[1].errno != errno.EEXIST:
+            raise
+    status = os.lstat(directory)
+    if not stat.S_ISDIR(status.st_mode) or \
+            status.st_uid != os.getuid() or \
+            stat.S_IMODE(status.st_mode) & int("077", 8):
+        raise OSError(errno.EACCES,
+                      "not a private directory of the current user",
+                      directory)
+
+def _peer_uid(connection):
+    "Returns the user ID of the peer or None if it's unknown."
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    credentials = connection.getsockopt(socket.SOL_SOCKET,
+                                        socket.SO_PEERCRED,
+                                        struct.calcsize("3i"))
+    return struct.unpack("3i", credentials)[1]
+
+def _check_peer(connection):
+    "Raises socket.error if the peer is ran by another user."
+    uid = _peer_uid(connection)
+    if uid is not None and uid != os.getuid():
+        raise socket.error(errno.EACCES,
+                           "connected with another user: %d" % uid)
+
+def _jsonable(value):
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return str(value)
+
+_result_classes = dict([(result_class.__name__, result_class)
+                        for result_class in [Success] + FAULT_ORDER])
+
+def _dump_event(event):
+    """
+    Converts an event recorded by EventRecorder to a value that
+    can be encoded as JSON.
+    """
+    if event[0] != "result":
+        return [_jsonable(value) for value in event]
+    index, result_class, state = event[1:]
+    dumped_state = {}
+    for key, value in state.items():
+        if key == "traceback" and value is not None:
+            value = [[entry.file_name, entry.line_number, entry.name,
+                      entry.content]
+                     for entry in value]
+        dumped_state[key] = _jsonable(value)
+    return ["result", index, result_class.__name__, dumped_state]
+
+def _load_event(event):
+    "Converts a value dumped by _dump_event() to an event."
+    if event[0] != "result":
+        return tuple(event)
+    index, class_name, state = event[1:]
+    traceback = state.get("traceback")
+    if traceback is not None:
+        state["traceback"] = [TracebackEntry(*entry) for entry in traceback]
+    return ("result", index, _result_classes[class_name], state)
+
+def _dump_test(test):
+    snapshot = TestSnapshot(test)
+    state = snapshot.__getstate__()
+    state["_data_value"] = _jsonable(state["_data_value"])
+    if state["metadata"] is not None:
+        state["metadata"] = dict([(key, _jsonable(value))
+                                  for key, value in state["metadata"].items()])
+    return state
+
+def _load_test(state):
+    snapshot = TestSnapshot.__new__(TestSnapshot)
+    snapshot.__setstate__(state)
+    return snapshot
+
+def read_frame(input):
+    """
+    Reads a frame sent by a server from input. None is returned
+    at the end of input.
+    """
+    line = input.readline()
+    if not line:
+        return None
+    frame = json.loads(line.decode("utf-8"))
+    name = frame[0]
+    if name == "test":
+        return (name, _load_test(frame[1]))
+    elif name == "event":
+        event_time, event = frame[1]
+        return (name, (event_time, _load_event(event)))
+    return tuple(frame)
+
+class _Channel(object):
+    "Sends frames to a client as JSON Lines."
+    def __init__(self, connection):
+        self._output = connection.makefile("wb")
+        self.broken = False
+
+    def send(self, frame):
+        if self.broken:
+            return
+        try:
+            line = json.dumps(frame, separators=(",", ":")) + "\n"
+            self._output.write(line.encode("utf-8"))
+            self._output.flush()
+        except (IOError, OSError, socket.error):
+            self.broken = True
+
+    def close(self):
+        try:
+            self._output.close()
+        except (IOError, OSError, socket.error):
+            pass
+
+class _ChannelOutput(object):
+    "A file-like object that sends written text to a client."
+    def __init__(self, channel):
+        self._channel = channel
+
+    def write(self, text):
+        self._channel.send(("output", text))
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+class _EventStreamer(EventRecorder):
+    """
+    A listener that sends events of tests to a client as soon as
+    they occur. A snapshot of each test is sent before its
+    first event.
+    """
+    def __init__(self, channel):
+        EventRecorder.__init__(self, [])
+        self._channel = channel
+
+    def _index(self, test):
+        index = self._indexes.get(id(test))
+        if index is None:
+            index = len(self._indexes)
+            self._indexes[id(test)] = index
+            self._channel.send(("test", _dump_test(test)))
+        return index
+
+    def _record(self, event):
+        self._channel.send(("event", (time.time(), _dump_event(event))))
+
+    def on_start_test_suite(self, context, test_suite):
+        self._record(("start_test_suite",))
+
+    def on_finish_test_suite(self, context, test_suite):
+        self._record(("finish_test_suite",))
+
+    def on_start_test_case(self, context, test_case):
+        self._channel.send(("test_case",
+                            test_case.__name__, test_case.__doc__))
+        EventRecorder.on_start_test_case(self, context, test_case)
+
+    def on_start_test(self, context, test):
+        if self._channel.broken:
+            context.interrupt()
+        EventRecorder.on_start_test(self, context, test)
+
+class _StreamingRunner(object):
+    def __init__(self, channel):
+        self._channel = channel
+
+    def run(self, test, listeners=[], context=None):
+        context.add_listener(_EventStreamer(self._channel))
+        context.add_listeners(listeners)
+        test.run(context)
+        return context
+
+class _ServerTester(Tester):
+    def __init__(self, channel, version=None):
+        Tester.__init__(self, version)
+        self._channel = channel
+
+    def _create_runner(self, options):
+        return _StreamingRunner(self._channel)
+
+class TestServer(object):
+    """
+    A server that runs tests requested by pikzie.client in its
+    own process. Imported test modules and their dependencies
+    are kept loaded between runs and only modules whose files
+    are changed are reloaded before each run.
+
+    The socket is created in a directory that only the current
+    user can access and requests from other users are ignored.
+    Test results are stored relative to the current directory
+    of the client.
+    """
+    def __init__(self, path=None, version=None):
+        self.path = path or default_path()
+        self.version = version
+        self._mtimes = {}
+
+    def serve_forever(self):
+        Tester.ran = True
+        if os.path.dirname(self.path) == _runtime_directory():
+            _prepare_private_directory(_runtime_directory())
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(int("077", 8))
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(umask)
+        server.listen(1)
+        try:
+            while True:
+                connection = server.accept()[0]
+                try:
+                    self.handle(connection)
+                finally:
+                    connection.close()
+        finally:
+            server.close()
+            os.remove(self.path)
+
+    def handle(self, connection):
+        "Runs tests requested by a client connected by connection."
+        try:
+            _check_peer(connection)
+        except socket.error:
+            return
+        input = connection.makefile("rb")
+        try:
+            line = input.readline()
+        finally:
+            input.close()
+        if not line:
+            return
+        request = json.loads(line.decode("utf-8"))
+        channel = _Channel(connection)
+        cwd = os.getcwd()
+        stdout, stderr = sys.stdout, sys.stderr
+        use_script_directory = pikzie.result_store.use_script_directory
+        result_store = TestCase.result_store
+        sys.stdout = sys.stderr = _ChannelOutput(channel)
+        try:
+            try:
+                os.chdir(request["cwd"])
+                pikzie.result_store.use_script_directory = False
+                TestCase.result_store = LogResultStore()
+                TestCase._relevant_codes.clear()
+                self._reload_changed_modules()
+                status = _ServerTester(channel, self.version).run(
+                    request["args"])
+            except SystemExit:
+                status = sys.exc_info()[1].code
+            except Exception:
+                traceback.print_exc()
+                status = 2
+        finally:
+            self._record_mtimes()
+            sys.stdout, sys.stderr = stdout, stderr
+            pikzie.result_store.use_script_directory = use_script_directory
+            TestCase.result_store = result_store
+            os.chdir(cwd)
+        channel.send(("status", status))
+        channel.close()
+
+    def _module_files(self):
+        for name, module in list(sys.modules.items()):
+            if name == "__main__" or name == "pikzie" or \
+                    name.startswith("pikzie."):
+                continue
+            path = getattr(module, "__file__", None)
+            if not path:
+                continue
+            if path.endswith(".pyc") or path.endswith(".pyo"):
+                path = path[:-1]
+            yield name, module, os.path.abspath(path)
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _record_mtimes(self):
+        for name, module, path in self._module_files():
+            if name not in self._mtimes:
+                self._mtimes[name] = (path, self._mtime(path))
+
+    def _reload_changed_modules(self):
+        for name, module, path in self._module_files():
+            if name not in self._mtimes:
+                continue
+            recorded_path, mtime = self._mtimes[name]
+            current_mtime = self._mtime(recorded_path)
+            if current_mtime == mtime:
+                continue
+            self._mtimes[name] = (recorded_path, current_mtime)
+            try:
+                _reload(module)
+            except ImportError:
+                # Test modules can't be found after the loader
+                # removes the base directory from the search
+                # path. They are imported again by the loader.
+                del sys.modules[name]
+            except Exception:
+                sys.stderr.write("failed to reload %s:\n" % name)
+                traceback.print_exc()
+
+def main(args=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--socket", metavar="PATH", dest="path",
+                      help="Listen on PATH (default: %s)" % default_path())
+    parser.add_option("--path", metavar="DIR", action="append",
+                      dest="load_paths", default=[],
+                      help="Add DIR to the module search path")
+    options, args = parser.parse_args(args)
+    for load_path in options.load_paths:
+        sys.path.insert(0, os.path.abspath(load_path))
+    try:
+        TestServer(options.path).serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
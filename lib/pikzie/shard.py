@@ -0,0 +1,58 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import zlib
+
+__all__ = ["parse_shard", "assign_shards"]
+
+def parse_shard(shard):
+    """
+    Parses "I/N" into (I, N). I is 1 origin.
+
+      parse_shard("2/4") # => (2, 4)
+    """
+    match = re.match(r"^(\d+)/(\d+)$", shard)
+    if not match:
+        raise ValueError("shard should be I/N: %r" % shard)
+    index, count = int(match.group(1)), int(match.group(2))
+    if not (1 <= index <= count):
+        raise ValueError("shard index should be in 1..%d: %r" % (count, shard))
+    return index, count
+
+def _hash(id):
+    return zlib.crc32(id.encode("utf-8")) & 0xffffffff
+
+def assign_shards(ids, count, durations=None):
+    """
+    Returns a shard number (1 origin) for each ID in ids.
+
+    If durations are given, IDs are assigned longest first to
+    the shard that has the least total duration so that shards
+    take about the same time. Ties are broken by ID. Otherwise
+    IDs are assigned by a stable hash of ID. The result only
+    depends on ids and durations, not on their order.
+    """
+    if durations is None:
+        return [_hash(id) % count + 1 for id in ids]
+
+    loads = [0.0] * count
+    shards = {}
+    for duration, id in sorted(zip(durations, ids),
+                               key=lambda item: (-item[0], item[1])):
+        shard = loads.index(min(loads))
+        loads[shard] += duration
+        shards[id] = shard + 1
+    return [shards[id] for id in ids]
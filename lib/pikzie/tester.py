@@ -19,7 +19,14 @@ from optparse import OptionParser
 
 from pikzie.core import *
 from pikzie.ui.console import *
+from pikzie.parallel import ParallelTestSuite
+from pikzie.result_store import LogResultStore
+from pikzie.shard import parse_shard
+from pikzie.discovery import DiscoveryCache
 import pikzie.report
+from pikzie.usage import UsageRecorder
+from pikzie.profiling import Profiler
+from pikzie.impact import ImpactMap, ImpactRecorder, read_changed_files
 
 class Tester(object):
     """
@@ -51,20 +58,72 @@ class Tester(object):
             "test_names": options.pop("test_names"),
             "test_case_names": options.pop("test_case_names"),
             "target_modules": self.target_modules,
-            "priority_mode": options.pop("priority_mode")
+            "priority_mode": options.pop("priority_mode"),
+            "async_concurrency": options.pop("async_concurrency"),
+            "shard": options.pop("shard"),
+            "static_discovery": options.pop("static_discovery"),
         }
+        discovery_cache = options.pop("discovery_cache")
+        if discovery_cache:
+            if discovery_cache == "auto":
+                discovery_cache = None
+            test_suite_create_options["discovery_cache"] = \
+                DiscoveryCache(discovery_cache)
+        impact_map = ImpactMap(options.pop("impact_map"))
+        record_impact = options.pop("record_impact")
+        changed = options.pop("changed")
+        if changed:
+            test_suite_create_options["changed_files"] = \
+                read_changed_files(changed)
+            test_suite_create_options["impact_map"] = impact_map
+        shard_durations = options.pop("shard_durations")
+        if shard_durations:
+            test_suite_create_options["shard_durations"] = \
+                LogResultStore(shard_durations)
+        result_log = options.pop("result_log")
+        if result_log:
+            TestCase.result_store = LogResultStore(result_log)
         xml_report = options.pop("xml_report")
-        test = TestLoader(**test_suite_create_options).create_test_suite(args)
-        runner = ConsoleTestRunner(**options)
+        jsonl_report = options.pop("jsonl_report")
+        trace_report = options.pop("trace_report")
+        jobs = options.pop("jobs")
+        retention = options.pop("retention")
+        measure_usage = options.pop("measure_usage")
+        strict_usage_budget = options.pop("strict_usage_budget")
+        profile = options.pop("profile")
+        profile_top = options.pop("profile_top")
+        profile_threshold = options.pop("profile_threshold")
+        loader = TestLoader(**test_suite_create_options)
+        if options.pop("list_tests"):
+            for test_id in loader.list_test_ids(args):
+                print(test_id)
+            return 0
+        test = loader.create_test_suite(args)
+        if jobs != 1:
+            test = ParallelTestSuite(test, jobs)
+        runner = self._create_runner(options)
         listeners = []
+        if measure_usage or strict_usage_budget:
+            listeners.append(UsageRecorder(strict_usage_budget))
+        if profile:
+            listeners.append(Profiler(profile, profile_top, profile_threshold))
+        if record_impact:
+            listeners.append(ImpactRecorder(impact_map))
         if xml_report:
             listeners.append(pikzie.report.XML(xml_report))
-        context = runner.run(test, listeners)
+        if jsonl_report:
+            listeners.append(pikzie.report.JSONLines(jsonl_report))
+        if trace_report:
+            listeners.append(pikzie.report.TraceEvents(trace_report))
+        context = runner.run(test, listeners, TestRunnerContext(retention))
         if context.succeeded:
             return 0
         else:
             return 1
 
+    def _create_runner(self, options):
+        return ConsoleTestRunner(**options)
+
     def _parse(self, args):
         parser = OptionParser(version=self.version,
                               usage="%prog [options] [test_files]")
@@ -90,12 +149,95 @@ class Tester(object):
         group.add_option("--xml-report", metavar="FILE",
                          dest="xml_report",
                          help="Report test result to FILE as XML")
+        group.add_option("--jsonl-report", metavar="FILE",
+                         dest="jsonl_report",
+                         help="Report test results to FILE as JSON Lines")
+        group.add_option("--trace-report", metavar="FILE",
+                         dest="trace_report",
+                         help="Report timeline of tests to FILE as "
+                         "Trace Event Format JSON")
         group.add_option("--priority", action="store_true", default=False,
                          dest="priority_mode", help="Use priority mode")
         group.add_option("--no-priority", action="store_false",
                          dest="priority_mode", help="Not use priority mode")
+        group.add_option("-j", "--jobs", metavar="N", type="int", default=1,
+                         dest="jobs",
+                         help="Run test cases in N processes. "
+                         "0 means the number of CPUs (default: 1)")
+        group.add_option("--async-concurrency", metavar="N", type="int",
+                         dest="async_concurrency",
+                         help="Run at most N async tests of a test case "
+                         "concurrently")
+        group.add_option("--shard", metavar="I/N", dest="shard",
+                         help="Run only tests in the I-th shard of N shards. "
+                         "Tests are assigned to shards by their IDs")
+        group.add_option("--shard-durations", metavar="FILE",
+                         dest="shard_durations",
+                         help="Balance shards of --shard by elapsed times "
+                         "recorded in FILE that is a result log shared "
+                         "by all shards")
+        group.add_option("--result-log", metavar="FILE", dest="result_log",
+                         help="Record test results to FILE "
+                         "(default: .test-result/%s)" % \
+                             LogResultStore.file_name)
+        group.add_option("--retention", metavar="MODE", dest="retention",
+                         choices=["all", "compact"],
+                         help="Keep all results in memory (all) or "
+                         "spill faults to a temporary file (compact) "
+                         "(default: all)")
+        group.add_option("--measure-usage", action="store_true",
+                         default=False, dest="measure_usage",
+                         help="Measure CPU time and memory usage of each test "
+                         "and notify tests that exceed their max_cpu_time "
+                         "or max_memory metadata")
+        group.add_option("--strict-usage-budget", action="store_true",
+                         default=False, dest="strict_usage_budget",
+                         help="Same as --measure-usage but tests that exceed "
+                         "their budgets fail")
+        group.add_option("--profile", metavar="DIR", dest="profile",
+                         help="Profile each test by cProfile and save "
+                         "profiles of tests, test cases and the suite to DIR")
+        group.add_option("--profile-top", metavar="N", type="int", default=20,
+                         dest="profile_top",
+                         help="Show N functions by cumulative time in "
+                         "the suite profile (default: 20)")
+        group.add_option("--profile-threshold", metavar="SECONDS",
+                         type="float", dest="profile_threshold",
+                         help="Save profiles of only tests that take "
+                         "SECONDS or more")
+        group.add_option("--record-impact", action="store_true",
+                         default=False, dest="record_impact",
+                         help="Record source files and functions executed "
+                         "by each test to the impact map")
+        group.add_option("--changed", metavar="FILE", dest="changed",
+                         help="Run only tests affected by changed files "
+                         "listed in FILE one per line. '-' reads them from "
+                         "the standard input")
+        group.add_option("--impact-map", metavar="FILE", dest="impact_map",
+                         help="Use FILE as the impact map "
+                         "(default: .test-result/%s)" % ImpactMap.file_name)
+        group.add_option("--discovery-cache", metavar="FILE",
+                         dest="discovery_cache", nargs=1,
+                         help="Cache test files and tests in them to FILE. "
+                         "'auto' uses .test-result/%s" % \
+                             DiscoveryCache.file_name)
+        group.add_option("--static-discovery", action="store_true",
+                         default=False, dest="static_discovery",
+                         help="Find tests by parsing test files and import "
+                         "only test files that have target tests")
+        group.add_option("--list", action="store_true", default=False,
+                         dest="list_tests",
+                         help="List IDs of target tests and exit")
         ConsoleTestRunner.setup_options(parser)
-        return parser.parse_args(args)
+        options, args = parser.parse_args(args)
+        if options.shard:
+            try:
+                options.shard = parse_shard(options.shard)
+            except ValueError:
+                parser.error(str(sys.exc_info()[1]))
+        if options.record_impact and options.profile:
+            parser.error("--record-impact can't be used with --profile")
+        return options, args
 
 auto_test_run_reject_pattern = \
     r"\b(?:pydoc[\d.]*|setup\.py|ipython[\d.]*|easy_install[\d.]*)$"
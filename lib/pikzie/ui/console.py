@@ -17,6 +17,9 @@ import sys
 import os
 import math
 import re
+import time
+import heapq
+import threading
 
 from optparse import OptionValueError
 
@@ -24,12 +27,17 @@ import pikzie.color
 from pikzie.core import *
 from pikzie.results import *
 import pikzie.pretty_print as pp
+from pikzie.usage import format_size
 
 VERBOSE_LEVEL_SILENT = 0
 VERBOSE_LEVEL_NORMAL = 1
 VERBOSE_LEVEL_VERBOSE = 2
 
 class ConsoleTestRunner(object):
+    flush_size = 8192
+    flush_interval = 1.0
+    n_top_usages = 5
+
     def setup_color_option(cls, group):
         available_values = "[yes|true|no|false|auto]"
         def store_use_color(option, opt, value, parser):
@@ -77,15 +85,21 @@ class ConsoleTestRunner(object):
                          dest="verbose_level", nargs=1, type="string", help=help)
     setup_verbose_option = classmethod(setup_verbose_option)
 
+    def setup_slowest_option(cls, group):
+        group.add_option("--slowest", metavar="N", type="int", dest="slowest",
+                         help="Show N slowest tests")
+    setup_slowest_option = classmethod(setup_slowest_option)
+
     def setup_options(cls, parser):
         group = parser.add_option_group("Console UI", "Options for console UI")
         cls.setup_color_option(group)
         cls.setup_color_scheme_option(group)
         cls.setup_verbose_option(group)
+        cls.setup_slowest_option(group)
     setup_options = classmethod(setup_options)
 
     def __init__(self, output=sys.stdout, use_color=None, verbose_level=None,
-                 color_scheme=None):
+                 color_scheme=None, slowest=None):
         if use_color is None:
             use_color = self._detect_color_availability()
         self.use_color = use_color
@@ -95,13 +109,28 @@ class ConsoleTestRunner(object):
         self.output = output
         self.color_scheme = pikzie.color.SCHEMES[color_scheme or "default"]
         self.reset_color = pikzie.color.COLORS["reset"]
-
-    def run(self, test, listeners=[]):
+        self.slowest = slowest
+        self._slowest_tests = []
+        self._benchmarks = []
+        self._cpu_times = []
+        self._memories = []
+        self._interactive = self._detect_interactive(output)
+        self._buffer = []
+        self._buffer_size = 0
+        self._last_flush_time = time.time()
+        self._buffer_lock = threading.RLock()
+        self._flush_timer = None
+
+    def run(self, test, listeners=[], context=None):
         "Run the given test case or test suite."
-        context = TestRunnerContext()
+        if context is None:
+            context = TestRunnerContext()
         context.add_listener(self)
         context.add_listeners(listeners)
-        test.run(context)
+        try:
+            test.run(context)
+        finally:
+            self._flush()
         return context
 
     def on_start_test_case(self, context, test_case):
@@ -114,9 +143,13 @@ class ConsoleTestRunner(object):
         if self.verbose_level == VERBOSE_LEVEL_NORMAL:
             self._writeln()
         self._print_faults(context)
+        self._print_benchmarks()
+        self._print_slowest_tests()
+        self._print_usage()
         self._writeln("Finished in %.3f seconds" % context.elapsed)
         self._writeln()
         self._writeln(context.summary(), self._result_color(context))
+        self._flush()
 
     def _generate_test_case_description(self, test_case):
         if not test_case.__doc__:
@@ -154,10 +187,12 @@ class ConsoleTestRunner(object):
     def on_success(self, context, test):
         self._flood_notifications()
         self._write(".", self.color_scheme["success"])
+        self._pool_benchmark(test)
 
     def _on_fault(self, context, fault):
         self._flood_notifications()
         self._write_fault(fault)
+        self._pool_benchmark(fault)
 
     on_failure = _on_fault
     on_error = _on_fault
@@ -175,11 +210,47 @@ class ConsoleTestRunner(object):
 
     def on_finish_test(self, context, test):
         self._flood_notifications()
-        self._writeln(level=VERBOSE_LEVEL_VERBOSE)
+        self._writeln(" %s" % self._format_phases(context.test_phases),
+                      level=VERBOSE_LEVEL_VERBOSE)
+        if self.slowest:
+            self._pool_slow_test(context.last_test_elapsed, test)
+
+    def _pool_slow_test(self, elapsed, test):
+        item = (elapsed, str(test))
+        if len(self._slowest_tests) < self.slowest:
+            heapq.heappush(self._slowest_tests, item)
+        else:
+            heapq.heappushpop(self._slowest_tests, item)
+
+    def on_usage(self, context, test, usage):
+        if "cpu_time" in usage:
+            self._pool_top(self._cpu_times, (usage["cpu_time"], str(test)))
+        memory = usage.get("peak_memory", usage.get("rss_delta"))
+        if memory is not None:
+            self._pool_top(self._memories, (memory, str(test)))
+
+    def _pool_top(self, heap, item):
+        if len(heap) < self.n_top_usages:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+
+    def _pool_benchmark(self, result):
+        if getattr(result, "benchmark", None) is not None:
+            self._benchmarks.append((str(result.test), result.benchmark))
 
     def on_finish_test_case(self, context, test_case):
+        self._writeln("  total: %s" %
+                      self._format_phases(context.test_case_phases),
+                      level=VERBOSE_LEVEL_VERBOSE)
         self._writeln(level=VERBOSE_LEVEL_VERBOSE)
 
+    def _format_phases(self, phases):
+        timings = ["%s: %.3fs" % (phase, phases[phase])
+                   for phase in ["setup", "test", "teardown"]
+                   if phase in phases]
+        return "(%s)" % ", ".join(timings)
+
     def _pool_notification(self, notification):
         self._n_notifications += 1
         self._last_notification = notification
@@ -198,7 +269,7 @@ class ConsoleTestRunner(object):
         self._last_notification = None
 
     def _fault_color(self, fault):
-        return self.color_scheme[fault.__class__.name]
+        return self.color_scheme[fault.name]
 
     def _write(self, arg, color=None, level=VERBOSE_LEVEL_NORMAL):
         if self.verbose_level < level:
@@ -207,8 +278,41 @@ class ConsoleTestRunner(object):
             arg = "%s%s%s" % (color.escape_sequence,
                               arg,
                               self.reset_color.escape_sequence)
-        self.output.write(arg)
-        self.output.flush()
+        self._buffer_lock.acquire()
+        try:
+            self._buffer.append(arg)
+            self._buffer_size += len(arg)
+            if (self._interactive or
+                self._buffer_size >= self.flush_size or
+                time.time() - self._last_flush_time >= self.flush_interval):
+                self._flush()
+            elif self._flush_timer is None:
+                self._start_flush_timer()
+        finally:
+            self._buffer_lock.release()
+
+    def _start_flush_timer(self):
+        # Buffered output is flushed by a timer too. Otherwise it
+        # isn't shown while a long test is running.
+        self._flush_timer = threading.Timer(self.flush_interval, self._flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def _flush(self):
+        self._buffer_lock.acquire()
+        try:
+            if self._flush_timer is not None:
+                if self._flush_timer is not threading.current_thread():
+                    self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._buffer:
+                self.output.write("".join(self._buffer))
+                self._buffer = []
+                self._buffer_size = 0
+            self.output.flush()
+            self._last_flush_time = time.time()
+        finally:
+            self._buffer_lock.release()
 
     def _write_fault(self, fault, level=VERBOSE_LEVEL_NORMAL):
         self._write(fault.symbol, self._fault_color(fault), level)
@@ -219,12 +323,12 @@ class ConsoleTestRunner(object):
         self._write("\n", level=level)
 
     def _print_faults(self, context):
-        size = len(context.faults)
+        size = context.n_faults
         if size == 0:
             return
         self._writeln()
         index_format = "%%%dd) " % (math.floor(math.log10(size)) + 1)
-        for i, fault in enumerate(context.faults):
+        for i, fault in enumerate(context.iter_faults()):
             self._write(index_format % (i + 1))
             self._writeln(fault.title(), self._fault_color(fault))
             if fault.test._data_label():
@@ -236,6 +340,34 @@ class ConsoleTestRunner(object):
             self._print_fault_message(fault)
             self._writeln()
 
+    def _print_benchmarks(self):
+        if len(self._benchmarks) == 0:
+            return
+        self._writeln("Benchmarks:")
+        for name, benchmark in self._benchmarks:
+            self._writeln("  %s: %s" % (name, benchmark))
+        self._writeln()
+
+    def _print_slowest_tests(self):
+        if len(self._slowest_tests) == 0:
+            return
+        self._writeln("Slowest tests:")
+        for elapsed, name in sorted(self._slowest_tests, reverse=True):
+            self._writeln("  %.3f seconds: %s" % (elapsed, name))
+        self._writeln()
+
+    def _print_usage(self):
+        if self._cpu_times:
+            self._writeln("Top CPU time:")
+            for cpu_time, name in sorted(self._cpu_times, reverse=True):
+                self._writeln("  %.3f seconds: %s" % (cpu_time, name))
+            self._writeln()
+        if self._memories:
+            self._writeln("Top memory usage:")
+            for memory, name in sorted(self._memories, reverse=True):
+                self._writeln("  %s: %s" % (format_size(memory), name))
+            self._writeln()
+
     def _print_traceback(self, traceback):
         if len(traceback) == 0:
             return
@@ -273,11 +405,10 @@ class ConsoleTestRunner(object):
                 self._writeln(folded_diff)
 
     def _result_color(self, context):
-        if len(context.faults) == 0:
-            return self.color_scheme["success"]
-        else:
-            sorted_faults = sorted(context.faults, key=fault_compare_key)
-            return self._fault_color(sorted_faults[0])
+        for fault_class in FAULT_ORDER:
+            if context.n_results(fault_class) > 0:
+                return self.color_scheme[fault_class.name]
+        return self.color_scheme["success"]
 
     def _file_name_color(self):
         return self.color_scheme["file-name"]
@@ -288,6 +419,15 @@ class ConsoleTestRunner(object):
     def _content_color(self):
         return self.color_scheme["content"]
 
+    def _detect_interactive(self, output):
+        isatty = getattr(output, "isatty", None)
+        if isatty is None:
+            return False
+        try:
+            return isatty()
+        except ValueError:
+            return False
+
     def _detect_color_availability(self):
         term = os.getenv("TERM")
         if term and (term.endswith("term") or
@@ -0,0 +1,139 @@
+# Copyright (C) 2011  Kouhei Sutou <kou@clear-code.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from pikzie.results import Failure, Notification
+
+__all__ = ["UsageRecorder", "format_size"]
+
+def _cpu_time():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def _rss():
+    try:
+        statm = open("/proc/self/statm")
+        try:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        finally:
+            statm.close()
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss
+    return max_rss * 1024
+
+def format_size(size):
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(size) < 1024:
+            return "%d%s" % (size, unit)
+        size /= 1024.0
+    return "%.1fGiB" % size
+
+class UsageRecorder(object):
+    """
+    A listener that measures CPU time, RSS delta and peak traced
+    memory of each test from its setup to its teardown. They are
+    reported by context.report_usage() and recorded to the result
+    store.
+
+    Tests can have budgets by "max_cpu_time" (seconds) and
+    "max_memory" (bytes) metadata. A test that exceeds its
+    budget gets a notification, or a failure if strict is True.
+
+    Tests ran concurrently by async concurrency aren't measured
+    because their usages can't be separated in a process.
+    """
+    run_in_worker = True
+
+    def __init__(self, strict=False, trace_memory=True):
+        self.strict = strict
+        self.trace_memory = trace_memory and tracemalloc is not None
+        self._started_tracing = False
+        self._start = None
+
+    def on_start_phase(self, context, test, phase):
+        if phase != "setup" or context.replaying or context.concurrent:
+            return
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            traced_memory = tracemalloc.get_traced_memory()[0]
+        else:
+            traced_memory = None
+        self._start = (_cpu_time(), _rss(), traced_memory)
+
+    def on_finish_phase(self, context, test, phase):
+        if phase != "teardown" or context.replaying or context.concurrent or \
+                self._start is None:
+            return
+        cpu_time, rss, traced_memory = self._start
+        self._start = None
+        usage = {}
+        if cpu_time is not None:
+            usage["cpu_time"] = _cpu_time() - cpu_time
+        if rss is not None:
+            usage["rss_delta"] = _rss() - rss
+        if traced_memory is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            usage["peak_memory"] = max(peak - traced_memory, 0)
+        test.result_store.update(test.id(), **usage)
+        context.report_usage(test, usage)
+        self._check_budgets(context, test, usage)
+
+    def on_finish_test_suite(self, context, test_suite):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _check_budgets(self, context, test, usage):
+        memory = usage.get("peak_memory", usage.get("rss_delta"))
+        max_memory = test.get_metadata("max_memory")
+        if max_memory is not None and memory is not None and \
+                memory > max_memory:
+            self._overrun(context, test,
+                          "memory usage exceeded budget: %s > %s" %
+                          (format_size(memory), format_size(max_memory)))
+        cpu_time = usage.get("cpu_time")
+        max_cpu_time = test.get_metadata("max_cpu_time")
+        if max_cpu_time is not None and cpu_time is not None and \
+                cpu_time > max_cpu_time:
+            self._overrun(context, test,
+                          "CPU time exceeded budget: %.3fs > %.3fs" %
+                          (cpu_time, max_cpu_time))
+
+    def _overrun(self, context, test, message):
+        if self.strict:
+            context.add_failure(test, Failure(test, message, []))
+        else:
+            context.add_notification(test, Notification(test, message, []))
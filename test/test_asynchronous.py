@@ -0,0 +1,123 @@
+import time
+import asyncio
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import pikzie
+from pikzie.ui.console import ConsoleTestRunner
+from test.utils import *
+
+class TestAsynchronous(pikzie.TestCase, Assertions):
+    """Tests for async tests."""
+
+    def setup(self):
+        self.output = StringIO()
+        self.runner = ConsoleTestRunner(self.output, use_color=False)
+        self.file_name = __file__
+        if self.file_name.endswith("pyc"):
+            self.file_name = self.file_name[:-1]
+
+    class TestCase(pikzie.TestCase):
+        async def setup(self):
+            await asyncio.sleep(0)
+            self.value = 1
+
+        async def test_success(self):
+            await asyncio.sleep(0)
+            self.assert_equal(1, self.value)
+
+        async def test_fail(self):
+            await asyncio.sleep(0)
+            self.assert_equal(2, self.value)
+
+    def test_run(self):
+        self.assert_result(False, 2, 1, 1, 0, 0, 0, 0,
+                           [("F", "TestCase.test_fail",
+                             "expected: <2>\n but was: <1>", None)],
+                           ["test_success", "test_fail"])
+
+    def test_is_async(self):
+        self.assert_equal((True, False),
+                          (self.TestCase("test_success").is_async(),
+                           TestAsynchronous("test_is_async").is_async()))
+
+    def test_failure_traceback(self):
+        format = \
+            "\n" \
+            "1) Failure: TestCase.test_fail: %s\n" \
+            "%s:%d: %s\n" \
+            "expected: <2>\n" \
+            " but was: <1>\n" \
+            "\n"
+        target_line = "self.assert_equal(2, self.value)"
+        line_no = Source.find_target_line_no(target_line)
+        details = format % (target_line, self.file_name, line_no, target_line)
+        self.assert_output("F", 1, 0, 1, 0, 0, 0, 0, details,
+                           [self.TestCase("test_fail")])
+
+    class SleepTestCase(pikzie.TestCase):
+        async def test_sleep1(self):
+            await asyncio.sleep(0.2)
+            self.assert_true(True)
+
+        async def test_sleep2(self):
+            await asyncio.sleep(0.2)
+            self.assert_true(True)
+
+        async def test_sleep3(self):
+            await asyncio.sleep(0.2)
+            self.assert_true(True)
+
+    def test_run_concurrently(self):
+        tests = [self.SleepTestCase(name)
+                 for name in ["test_sleep1", "test_sleep2", "test_sleep3"]]
+        runner = pikzie.core.TestCaseRunner(self.SleepTestCase, tests, False, 3)
+        context = pikzie.TestRunnerContext()
+        start = time.time()
+        runner.run(context)
+        self.assert_equal((3, 3, True),
+                          (context.n_tests, context.n_assertions,
+                           context.succeeded))
+        self.assert_true(time.time() - start < 0.5)
+
+    class TeardownTestCaseTestCase(pikzie.TestCase):
+        async def teardown_test_case(cls):
+            raise IOError("teardown_test_case")
+        teardown_test_case = classmethod(teardown_test_case)
+
+        async def test_sleep1(self):
+            await asyncio.sleep(0.1)
+
+        async def test_sleep2(self):
+            await asyncio.sleep(0.2)
+
+    def test_run_concurrently_teardown_test_case_error(self):
+        test_case = self.TeardownTestCaseTestCase
+        tests = [test_case("test_sleep2"), test_case("test_sleep1")]
+        runner = pikzie.core.TestCaseRunner(test_case, tests, False, 2)
+        context = pikzie.TestRunnerContext()
+        runner.run(context)
+        self.assert_equal([("success", "test_sleep1"),
+                           ("error", "test_sleep2")],
+                          [(result.name, result.test.short_name())
+                           for result in context.results])
+
+    class InterruptTestCase(pikzie.TestCase):
+        async def test_interrupt(self):
+            raise KeyboardInterrupt
+
+        async def test_sleep(self):
+            await asyncio.sleep(0.01)
+
+    def test_run_concurrently_interrupt(self):
+        test_case = self.InterruptTestCase
+        tests = [test_case("test_sleep"), test_case("test_interrupt"),
+                 test_case("test_sleep")]
+        runner = pikzie.core.TestCaseRunner(test_case, tests, False, 2)
+        context = pikzie.TestRunnerContext()
+        runner.run(context)
+        self.assert_equal((True, 2),
+                          (context.need_interrupt(), context.n_tests))
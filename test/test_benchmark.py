@@ -0,0 +1,49 @@
+import pikzie
+from pikzie.benchmarking import Benchmark
+from pikzie.result_store import ResultStore
+
+class TestBenchmark(pikzie.TestCase):
+    """Tests for benchmark tests."""
+
+    class TestCase(pikzie.TestCase):
+        n_calls = 0
+
+        def test_sum(self):
+            self.__class__.n_calls += 1
+            self.assert_equal(4950, sum(range(100)))
+        test_sum = pikzie.benchmark(repeat=5, warmup=2,
+                                    max_regression=2.0)(test_sum)
+
+    def setup(self):
+        self.TestCase.n_calls = 0
+        self.TestCase.result_store = ResultStore()
+
+    def test_statistics(self):
+        benchmark = Benchmark([3.0, 1.0, 2.0, 6.0])
+        self.assert_equal((4, 1.0, 2.5),
+                          (benchmark.runs, benchmark.min, benchmark.median))
+        self.assert_in_delta(1.870828, benchmark.stddev, 0.000001)
+
+    def test_baseline(self):
+        context = self._run()
+        result = context.results[0]
+        self.assert_equal(("success", 7, 5),
+                          (result.name, self.TestCase.n_calls,
+                           result.benchmark.runs))
+        self.assert_equal(result.benchmark.median,
+                          self.TestCase.result_store.get(
+                              "test_benchmark.TestCase.test_sum",
+                              "benchmark_baseline"))
+
+    def test_regression(self):
+        self.TestCase.result_store.update("test_benchmark.TestCase.test_sum",
+                                          benchmark_baseline=0.0000000001)
+        context = self._run()
+        result = context.results[0]
+        self.assert_equal("failure", result.name)
+        self.assert_match("benchmark regressed: median: ", result.message)
+
+    def _run(self):
+        context = pikzie.TestRunnerContext()
+        self.TestCase("test_sum").run(context)
+        return context
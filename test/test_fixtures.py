@@ -0,0 +1,98 @@
+import pikzie
+from pikzie.fixtures import FixtureRegistry, FixtureSet, FixtureError
+
+class TestFixtures(pikzie.TestCase):
+    """Tests for fixtures shared in a test run."""
+
+    def setup(self):
+        self.calls = []
+        self.registry = FixtureRegistry()
+        calls = self.calls
+        def database():
+            calls.append("setup database")
+            yield "database"
+            calls.append("teardown database")
+        def server(database):
+            calls.append("setup server")
+            yield "server with %s" % database
+            calls.append("teardown server")
+        def unused():
+            calls.append("setup unused")
+        self.registry.define("database", database)
+        self.registry.define("server", server, ["database"])
+        self.registry.define("unused", unused)
+
+    def test_lazy(self):
+        fixtures = FixtureSet(self.registry)
+        self.assert_equal([], self.calls)
+        self.assert_equal(("server with database", "database"),
+                          (fixtures.get("server"), fixtures.get("database")))
+        fixtures.teardown()
+        self.assert_equal(["setup database", "setup server",
+                           "teardown server", "teardown database"],
+                          self.calls)
+
+    def test_unknown(self):
+        self.registry.define("cache", lambda server, nonexistent: None,
+                             ["server", "nonexistent"])
+        error = self.assert_raise_call(FixtureError,
+                                       self.registry.resolve, ["cache"])
+        self.assert_equal("unknown fixture: nonexistent (required by cache)",
+                          str(error))
+
+    def test_circular(self):
+        self.registry.define("a", lambda b: None, ["b"])
+        self.registry.define("b", lambda a: None, ["a"])
+        error = self.assert_raise_call(FixtureError,
+                                       self.registry.resolve, ["a"])
+        self.assert_equal("circular fixture dependency: a -> b -> a",
+                          str(error))
+
+    def test_uses(self):
+        calls = self.calls
+        def counter():
+            calls.append("setup counter")
+            yield [0]
+            calls.append("teardown counter")
+        pikzie.fixture("test_fixtures.counter")(counter)
+
+        class TestCase(pikzie.TestCase):
+            def test_one(self):
+                self.fixture("test_fixtures.counter")[0] += 1
+            test_one = pikzie.uses("test_fixtures.counter")(test_one)
+
+            def test_two(self):
+                self.fixture("test_fixtures.counter")[0] += 1
+            test_two = pikzie.uses("test_fixtures.counter")(test_two)
+
+        context = pikzie.TestRunnerContext()
+        suite = pikzie.TestSuite([TestCase("test_one"), TestCase("test_two")])
+        suite.run(context)
+        self.assert_equal((2, ["setup counter", "teardown counter"]),
+                          (context.n_tests, calls))
+
+    def test_uses_concurrently(self):
+        calls = self.calls
+        def counter():
+            calls.append("setup counter")
+            yield [0]
+            calls.append("teardown counter")
+        pikzie.fixture("test_fixtures.async_counter")(counter)
+
+        class TestCase(pikzie.TestCase):
+            async def test_one(self):
+                self.fixture("test_fixtures.async_counter")[0] += 1
+            test_one = pikzie.uses("test_fixtures.async_counter")(test_one)
+
+            async def test_two(self):
+                self.fixture("test_fixtures.async_counter")[0] += 1
+            test_two = pikzie.uses("test_fixtures.async_counter")(test_two)
+
+        context = pikzie.TestRunnerContext()
+        runner = pikzie.core.TestCaseRunner(TestCase,
+                                            [TestCase("test_one"),
+                                             TestCase("test_two")],
+                                            False, 2)
+        pikzie.TestSuite([runner]).run(context)
+        self.assert_equal((2, ["setup counter", "teardown counter"]),
+                          (context.n_tests, calls))
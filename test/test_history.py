@@ -0,0 +1,56 @@
+import pikzie
+import pikzie.history
+from pikzie.result_store import ResultStore
+
+class TestHistory(pikzie.TestCase):
+    """Tests for duration history."""
+
+    class TestCase(pikzie.TestCase):
+        result_store = ResultStore()
+
+        def test_fast(self):
+            pass
+
+        def test_slow(self):
+            pass
+
+        def test_new(self):
+            pass
+
+    def setup(self):
+        store = ResultStore()
+        store.update(self.TestCase("test_fast").id(), elapsed=1.0)
+        store.update(self.TestCase("test_slow").id(), elapsed=3.0)
+        self.TestCase.result_store = store
+
+    def test_test_duration(self):
+        self.assert_equal((3.0, None),
+                          (pikzie.history.test_duration(self._test("slow")),
+                           pikzie.history.test_duration(self._test("new"))))
+
+    def test_estimate_durations(self):
+        tests = [self._test("fast"), self._test("slow"), self._test("new")]
+        self.assert_equal([1.0, 3.0, 2.0],
+                          pikzie.history.estimate_durations(tests))
+
+    def test_estimate_runner_durations(self):
+        runners = [self._runner("fast"), self._runner("slow", "new")]
+        self.assert_equal([1.0, 5.0],
+                          pikzie.history.estimate_runner_durations(runners))
+
+    def test_record_duration(self):
+        test = self._test("fast")
+        test.run(pikzie.TestRunnerContext())
+        duration = pikzie.history.test_duration(test)
+        self.assert_equal((True, True, True),
+                          (isinstance(duration, float),
+                           duration is not None and duration >= 0,
+                           duration != 1.0))
+
+    def _test(self, name):
+        return self.TestCase("test_%s" % name)
+
+    def _runner(self, *names):
+        return pikzie.core.TestCaseRunner(self.TestCase,
+                                          [self._test(name) for name in names],
+                                          False)
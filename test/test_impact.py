@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+import pikzie
+from pikzie.impact import ImpactMap, ImpactRecorder
+from pikzie.utils import *
+
+def helper():
+    return 29
+
+class TestImpact(pikzie.TestCase):
+    """Tests for test impact analysis."""
+
+    class TestCase(pikzie.TestCase):
+        def test_helper(self):
+            self.assert_equal(29, helper())
+
+        def test_nothing(self):
+            self.assert_true(True)
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.map_path = os.path.join(self.tmp_dir, "impact.json")
+        self.path = os.path.abspath(__file__)
+        if self.path.endswith(".pyc"):
+            self.path = self.path[:-1]
+
+    def teardown(self):
+        rm_rf(self.tmp_dir)
+
+    def test_record(self):
+        context = pikzie.TestRunnerContext()
+        context.add_listener(ImpactRecorder(ImpactMap(self.map_path)))
+        runner = pikzie.core.TestCaseRunner(self.TestCase,
+                                            [self.TestCase("test_helper"),
+                                             self.TestCase("test_nothing")],
+                                            priority_mode=False)
+        pikzie.TestSuite([runner]).run(context)
+        impact_map = ImpactMap(self.map_path)
+        helper_functions = impact_map.footprint(
+            "test_impact.TestCase.test_helper")[self.path]
+        nothing_functions = impact_map.footprint(
+            "test_impact.TestCase.test_nothing")[self.path]
+        self.assert_equal((True, False),
+                          ("helper" in helper_functions,
+                           "helper" in nothing_functions))
+
+    def test_is_affected(self):
+        impact_map = ImpactMap(self.map_path)
+        impact_map.store_footprint("test_a", {"/src/a.py": ["f"]})
+        impact_map.store_footprint("test_b", {"/src/b.py": ["g"]})
+        impact_map.save()
+        impact_map = ImpactMap(self.map_path)
+        changed_paths = set(["/src/a.py", "/test/test_c.py"])
+        self.assert_equal([True, False, True, True],
+                          [impact_map.is_affected("test_a", changed_paths),
+                           impact_map.is_affected("test_b", changed_paths),
+                           impact_map.is_affected("test_b", changed_paths,
+                                                  ["/test/test_c.py"]),
+                           impact_map.is_affected("test_new", changed_paths)])
+
+    def test_loader(self):
+        impact_map = ImpactMap(self.map_path)
+        impact_map.store_footprint("test_impact.TestCase.test_helper",
+                                   {"/src/a.py": ["f"]})
+        impact_map.store_footprint("test_impact.TestCase.test_nothing",
+                                   {"/src/b.py": ["g"]})
+        loader = pikzie.TestLoader(changed_files=["/src/a.py"],
+                                   impact_map=impact_map)
+        runners = loader._select_affected(
+            [(self.TestCase, [self.TestCase("test_helper"),
+                              self.TestCase("test_nothing")])])
+        self.assert_equal(["test_impact.TestCase.test_helper"],
+                          [test.id() for test in runners[0][1]])
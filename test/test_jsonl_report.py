@@ -0,0 +1,87 @@
+import json
+import warnings
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import pikzie
+import pikzie.report
+import pikzie.ui.console
+from test.utils import *
+
+class TestJSONLinesReport(pikzie.TestCase, Assertions):
+    """Tests for JSON Lines report."""
+
+    class TestCase(pikzie.TestCase):
+        def _test_success(self):
+            self.assert_true(True)
+
+        TEST_FAILURE_LINE = Source.current_line_no() + 2
+        def _test_failure(self):
+            self.assert_true(False)
+        _test_failure = pikzie.bug(1234)(_test_failure)
+
+    def test_records(self):
+        records = self._run(["_test_success", "_test_failure"])
+        for record in records:
+            del record["elapsed"]
+            record["phases"] = sorted(record["phases"].keys())
+        self.assert_equal(
+            [{"id": "test_jsonl_report.TestCase._test_success",
+              "test_case": "TestCase",
+              "test": "_test_success",
+              "status": "success",
+              "phases": ["setup", "teardown", "test"],
+              "metadata": {}},
+             {"id": "test_jsonl_report.TestCase._test_failure",
+              "test_case": "TestCase",
+              "test": "_test_failure",
+              "status": "failure",
+              "phases": ["setup", "teardown", "test"],
+              "metadata": {"bug": 1234},
+              "detail": "expected: <False> is a true value",
+              "traceback": [[Source.current_file(),
+                             self.TestCase.TEST_FAILURE_LINE,
+                             "self.assert_true(False)"]]}],
+            records)
+
+    def test_write_error(self):
+        class BrokenOutput(StringIO):
+            def write(self, string):
+                raise IOError("disk full")
+
+        class SmallQueueJSONLines(pikzie.report.JSONLines):
+            queue_size = 1
+
+        runner = pikzie.ui.console.ConsoleTestRunner(
+            verbose_level=pikzie.ui.console.VERBOSE_LEVEL_SILENT)
+        report = SmallQueueJSONLines(BrokenOutput())
+        suite = pikzie.TestSuite([self.TestCase("_test_success")
+                                  for i in range(6)])
+        finished_suites = []
+        class Listener(object):
+            def on_finish_test_suite(self, context, test_suite):
+                finished_suites.append(test_suite)
+        catch_warnings = warnings.catch_warnings(record=True)
+        messages = catch_warnings.__enter__()
+        try:
+            warnings.simplefilter("always")
+            runner.run(suite, [report, Listener()])
+        finally:
+            catch_warnings.__exit__(None, None, None)
+        self.assert_equal(([suite],
+                           ["failed to write JSON Lines report: "
+                            "OSError: disk full"]),
+                          (finished_suites,
+                           [str(message.message) for message in messages]))
+
+    def _run(self, names):
+        runner = pikzie.ui.console.ConsoleTestRunner(
+            verbose_level=pikzie.ui.console.VERBOSE_LEVEL_SILENT)
+        output = StringIO()
+        report = pikzie.report.JSONLines(output)
+        suite = pikzie.TestSuite([self.TestCase(name) for name in names])
+        runner.run(suite, [report])
+        return [json.loads(line) for line in output.getvalue().splitlines()]
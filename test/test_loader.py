@@ -1,5 +1,9 @@
 import os
+import sys
+import tempfile
 import pikzie
+from pikzie.utils import *
+from pikzie.discovery import DiscoveryCache, scan_source
 
 class TestLoader(pikzie.TestCase):
     """Tests for TestLoader"""
@@ -90,6 +94,54 @@ class TestLoader(pikzie.TestCase):
                            "test_yyy.TestYYY.test_xyz"],
                           sorted(self._collect_test_names(test_suite)))
 
+    def test_list_test_ids_with_discovery_cache(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        cache_path = os.path.join(self.tmp_dir, "discovery.json")
+        self.loader.discovery_cache = DiscoveryCache(cache_path)
+        self.loader.test_names = ["/one|xyz/"]
+        expected_ids = ["test_xxx.TestXXX1.test_one",
+                        "test_yyy.TestYYY.test_xyz"]
+        self.assert_equal(expected_ids,
+                          sorted(self.loader.list_test_ids()))
+
+        loader = self.NoImportLoader(base_dir=self.fixture_dir,
+                                     test_names=["/one|xyz/"],
+                                     discovery_cache=DiscoveryCache(cache_path))
+        self.assert_equal(expected_ids, sorted(loader.list_test_ids()))
+
+    def test_list_test_ids_with_static_discovery(self):
+        loader = self.NoImportLoader(base_dir=self.fixture_dir,
+                                     test_names=["/one|xyz/"],
+                                     static_discovery=True)
+        self.assert_equal(["test_xxx.TestXXX1.test_one",
+                           "test_yyy.TestYYY.test_xyz"],
+                          sorted(loader.list_test_ids()))
+
+    def test_static_inventory(self):
+        def sort_inventory(inventory):
+            return sorted([(test_case["name"], test_case["tests"])
+                           for test_case in inventory])
+        base_dir, targets = self.loader._find_targets()
+        sys.path.insert(0, base_dir)
+        try:
+            for target in targets:
+                module = self.loader._load_module(target)
+                path = os.path.join(base_dir, target)
+                self.assert_equal(
+                    sort_inventory(self.loader._inventory(module)),
+                    sort_inventory(scan_source(path, module.__name__)))
+        finally:
+            sys.path.remove(base_dir)
+
+    class NoImportLoader(pikzie.TestLoader):
+        def _load_module(self, target):
+            raise Exception("must not import: %s" % target)
+
+    tmp_dir = None
+    def teardown(self):
+        if self.tmp_dir:
+            rm_rf(self.tmp_dir)
+
     def _collect_test_names(self, test_suite):
         names = []
         for test_case_runner in test_suite._tests:
@@ -0,0 +1,100 @@
+import gc
+
+import pikzie
+from pikzie.parallel import ParallelTestSuite
+from test.utils import *
+
+class TestParallel(pikzie.TestCase, Assertions):
+    """Tests for running tests in worker processes."""
+
+    class TestCase1(pikzie.TestCase):
+        def test_success(self):
+            self.assert_equal(3, 1 + 2)
+
+        def test_failure(self):
+            self.assert_equal("aaaaa", "a")
+
+    class TestCase2(pikzie.TestCase):
+        def test_error(self):
+            self.unknown_method()
+
+        def test_notify(self):
+            self.notify("Call me!")
+            self.assert_true(True)
+
+    def test_same_result_as_sequential(self):
+        self.assert_equal(self._run(pikzie.TestSuite),
+                          self._run(self._parallel_test_suite))
+
+    class FreezeTestCase(pikzie.TestCase):
+        def test_frozen(self):
+            self.assert_true(gc.get_freeze_count() > 0)
+
+    def test_freeze_before_fork(self):
+        if not hasattr(gc, "freeze"):
+            self.omit("gc.freeze() isn't available")
+        freeze_count = gc.get_freeze_count()
+        context = pikzie.TestRunnerContext()
+        runner = pikzie.core.TestCaseRunner(self.FreezeTestCase,
+                                            [self.FreezeTestCase("test_frozen")],
+                                            False)
+        self._parallel_test_suite([runner]).run(context)
+        self.assert_equal((1, 1, 0),
+                          (context.n_tests, context.n_assertions,
+                           context.n_faults))
+        # Frozen objects inherited from a parent process may be freed.
+        self.assert_true(gc.get_freeze_count() <= freeze_count)
+
+    def test_listener_events(self):
+        recorder = self.EventNameRecorder()
+        context = pikzie.TestRunnerContext()
+        context.add_listener(recorder)
+        self._parallel_test_suite(self._runners()[:1]).run(context)
+        self.assert_equal(["start_test_suite",
+                           "start_test_case",
+                           "start_test",
+                           "start_phase", "finish_phase",
+                           "start_phase", "finish_phase",
+                           "failure",
+                           "start_phase", "finish_phase",
+                           "finish_test",
+                           "start_test",
+                           "start_phase", "finish_phase",
+                           "start_phase", "pass_assertion", "finish_phase",
+                           "start_phase", "finish_phase",
+                           "success",
+                           "finish_test",
+                           "finish_test_case",
+                           "finish_test_suite"],
+                          recorder.names)
+
+    class EventNameRecorder(object):
+        def __init__(self):
+            self.names = []
+
+        def __getattr__(self, name):
+            if not name.startswith("on_"):
+                raise AttributeError(name)
+            def record(context, *args):
+                self.names.append(name[len("on_"):])
+            return record
+
+    def _parallel_test_suite(self, tests):
+        return ParallelTestSuite(tests, 2)
+
+    def _runners(self):
+        runners = []
+        for test_case in [self.TestCase1, self.TestCase2]:
+            tests = [test for test in test_case.collect_test()
+                     if test.short_name().startswith("test_")]
+            runners.append(pikzie.core.TestCaseRunner(test_case, tests, False))
+        return runners
+
+    def _run(self, suite_class):
+        context = pikzie.TestRunnerContext()
+        suite_class(self._runners()).run(context)
+        results = [(result.name, str(result.test), result.detail())
+                   for result in context.results]
+        return ((context.n_tests, context.n_assertions, context.n_failures,
+                 context.n_errors, context.n_notifications),
+                sorted(results))
@@ -0,0 +1,84 @@
+import time
+import pprint
+import pikzie
+import pikzie.pretty_print as pp
+
+class TestPrettyPrint(pikzie.TestCase):
+    """Tests for pikzie.pretty_print."""
+
+    def test_format_diff(self):
+        self.assert_equal("  abc\n"
+                          "- def\n"
+                          "?   ^\n"
+                          "+ deg\n"
+                          "?   ^",
+                          pp.format_diff("abc\ndef", "abc\ndeg"))
+
+    def test_format_diff_large(self):
+        def format_lines(numbers):
+            return "".join([" %d,\n" % number for number in numbers])
+        expected = format_lines(range(50000))
+        actual = format_lines(list(range(20000)) + [-1] +
+                              list(range(20001, 50000)))
+        start = time.time()
+        diff = pp.format_diff(expected, actual)
+        self.assert_in_delta(0, time.time() - start, 1)
+        self.assert_equal("  ... (19997 same lines)\n"
+                          "   19997,\n"
+                          "   19998,\n"
+                          "   19999,\n"
+                          "-  20000,\n"
+                          "+  -1,\n"
+                          "   20001,\n"
+                          "   20002,\n"
+                          "   20003,\n"
+                          "  ... (29996 same lines)",
+                          diff)
+
+    def test_format_diff_expensive_hints(self):
+        expected = "\n".join(["%040d" % (i * 7919) for i in range(200)])
+        actual = "\n".join(["%040d" % (i * 7907) for i in range(200)])
+        start = time.time()
+        diff = pp.format_diff(expected, actual)
+        self.assert_in_delta(0, time.time() - start, 1)
+        self.assert_equal([], [line for line in diff.split("\n")
+                               if line.startswith("?")])
+
+    def test_format_diff_cache_limit(self):
+        expected = "a\n" * pp.diff_cache_character_limit
+        pp.format_diff(expected, expected + "b")
+        self.assert_false((expected, expected + "b") in pp._diff_cache)
+
+    def test_format_diff_output_limit(self):
+        expected = "\n".join(["a"] * 5000)
+        actual = "\n".join(["b"] * 5000)
+        diff = pp.format_diff(expected, actual).split("\n")
+        self.assert_equal((pp.diff_output_limit + 1, "... (truncated)"),
+                          (len(diff), diff[-1]))
+
+    def test_format_small(self):
+        value = {"a": [1, 2, 3], "b": "x" * 100}
+        self.assert_equal(pprint.pformat(value), pp.format(value))
+
+    def test_format_elided(self):
+        formatted = pp.format({"list": list(range(100000)),
+                               "string": "x" * 100000})
+        self.assert_equal((True, True, True),
+                          ("...(99000 items)..." in formatted,
+                           "...(90000 characters)..." in formatted,
+                           len(formatted) < pp.format_byte_limit))
+
+    def test_format_byte_limit_of_small_value(self):
+        formatted = pp.format(bytearray(pp.format_byte_limit * 2))
+        self.assert_true(len(formatted) < pp.format_byte_limit)
+
+    def test_format_elided_dict(self):
+        lines = pp.format(dict([(i, i) for i in range(3000)])).split("\n")
+        index = lines.index(" ...(2000 items)...: ...,")
+        self.assert_equal([" 499: 499,", " 2500: 2500,"],
+                          [lines[index - 1], lines[index + 1]])
+
+    def test_lazy_format(self):
+        value = pp.LazyFormat([1, 2, 3])
+        self.assert_equal(("[1, 2, 3]", None),
+                          (value.release(), value._object))
@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import pikzie
+from pikzie.profiling import Profiler
+from pikzie.result_store import ResultStore
+from pikzie.utils import *
+
+class TestProfiling(pikzie.TestCase):
+    """Tests for profiling tests."""
+
+    class TestCase(pikzie.TestCase):
+        def test_sum(self):
+            self.assert_equal(4950, sum(range(100)))
+
+        def test_sort(self):
+            self.assert_equal([1, 2, 3], sorted([3, 1, 2]))
+
+    def setup(self):
+        self.TestCase.result_store = ResultStore()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = StringIO()
+
+    def teardown(self):
+        rm_rf(self.tmp_dir)
+
+    def test_profile(self):
+        self._run(Profiler(self.tmp_dir, top=3, output=self.output))
+        self.assert_equal(
+            (["test_profiling.TestCase.test_sort.pstats",
+              "test_profiling.TestCase.test_sum.pstats"],
+             ["test_profiling.TestCase.pstats"],
+             True),
+            (sorted(os.listdir(os.path.join(self.tmp_dir, "tests"))),
+             os.listdir(os.path.join(self.tmp_dir, "test-cases")),
+             os.path.exists(os.path.join(self.tmp_dir, "suite.pstats"))))
+        self.assert_search("Ordered by: cumulative time",
+                           self.output.getvalue())
+
+    def test_threshold(self):
+        self.TestCase.result_store.update("test_profiling.TestCase.test_sum",
+                                          elapsed=0.0)
+        self._run(Profiler(self.tmp_dir, threshold=60.0, output=self.output))
+        self.assert_equal(([], ""),
+                          (os.listdir(self.tmp_dir), self.output.getvalue()))
+
+    class AsyncTestCase(pikzie.TestCase):
+        async def test_sum(self):
+            self.assert_equal(4950, sum(range(100)))
+
+        async def test_sort(self):
+            self.assert_equal([1, 2, 3], sorted([3, 1, 2]))
+
+    def test_concurrent(self):
+        test_case = self.AsyncTestCase
+        test_case.result_store = ResultStore()
+        context = pikzie.TestRunnerContext()
+        context.add_listener(Profiler(self.tmp_dir, output=self.output))
+        runner = pikzie.core.TestCaseRunner(test_case,
+                                            [test_case("test_sum"),
+                                             test_case("test_sort")],
+                                            False, 2)
+        pikzie.TestSuite([runner]).run(context)
+        self.assert_equal((["notification", "success",
+                            "notification", "success"],
+                           []),
+                          ([result.name for result in context.results],
+                           os.listdir(self.tmp_dir)))
+
+    def _run(self, profiler):
+        context = pikzie.TestRunnerContext()
+        context.add_listener(profiler)
+        runner = pikzie.core.TestCaseRunner(self.TestCase,
+                                            [self.TestCase("test_sum"),
+                                             self.TestCase("test_sort")],
+                                            priority_mode=False)
+        suite = pikzie.TestSuite([runner])
+        suite.run(context)
+        return context
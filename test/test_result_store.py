@@ -0,0 +1,64 @@
+import os
+import tempfile
+import pikzie
+from pikzie.utils import *
+from pikzie.result_store import ResultStore, LogResultStore
+
+tmp_dir = None
+log_path = None
+
+def setup():
+    global tmp_dir, log_path
+    tmp_dir = tempfile.mkdtemp()
+    log_path = os.path.join(tmp_dir, "results.log")
+
+def teardown():
+    rm_rf(tmp_dir)
+
+def test_memory_store():
+    store = ResultStore()
+    assert_none(store.get("test.TestX.test_a", "passed"))
+    store.update("test.TestX.test_a", passed=True)
+    assert_equal(True, store.get("test.TestX.test_a", "passed"))
+    assert_equal(False, store.get("test.TestX.test_b", "passed", False))
+
+def test_log_store_reload():
+    store = LogResultStore(log_path)
+    store.update("test.TestX.test_a", passed=True)
+    store.update("test.TestX.test_b", passed=False)
+    assert_not_exists(log_path)
+    store.flush()
+
+    reloaded_store = LogResultStore(log_path)
+    assert_equal((True, False),
+                 (reloaded_store.get("test.TestX.test_a", "passed"),
+                  reloaded_store.get("test.TestX.test_b", "passed")))
+
+def test_log_store_append_only_changes():
+    store = LogResultStore(log_path)
+    store.update("test.TestX.test_a", passed=True)
+    store.flush()
+    store.update("test.TestX.test_a", passed=True)
+    store.flush()
+    assert_equal(1, len(open(log_path).readlines()))
+
+def test_log_store_compact():
+    store = LogResultStore(log_path)
+    for passed in [True, False, True, False]:
+        store.update("test.TestX.test_a", passed=passed)
+        store.flush()
+    assert_equal(4, len(open(log_path).readlines()))
+    store.flush(compact=True)
+    assert_equal(['["test.TestX.test_a",{"passed":false}]\n'],
+                 open(log_path).readlines())
+
+def test_log_store_compact_appended_by_others():
+    store = LogResultStore(log_path)
+    store.get("test.TestX.test_a", "passed")
+    other_store = LogResultStore(log_path)
+    for passed in [True, False, True, False]:
+        other_store.update("test.TestX.test_a", passed=passed)
+        other_store.flush()
+    store.flush(compact=True)
+    assert_equal(['["test.TestX.test_a",{"passed":false}]\n'],
+                 open(log_path).readlines())
@@ -1,4 +1,5 @@
 import re
+import time
 
 try:
     from exceptions import *
@@ -11,6 +12,7 @@ except ImportError:
     from io import StringIO
 
 import pikzie
+from pikzie.result_store import ResultStore
 from pikzie.ui.console import ConsoleTestRunner
 
 from test.utils import *
@@ -233,3 +235,204 @@ class TestRunner(pikzie.TestCase, Assertions):
                             self.file_name, line_no, target_line, str(data))
         self.assert_output("F", 1, 1, 1, 0, 0, 0, 0, details, [test])
 
+
+    def test_buffered_output(self):
+        class Output(StringIO):
+            n_writes = 0
+            def write(self, string):
+                self.n_writes += 1
+                return StringIO.write(self, string)
+
+        class TestCase(pikzie.TestCase):
+            def test_nothing1(self):
+                pass
+
+            def test_nothing2(self):
+                pass
+
+        output = Output()
+        runner = ConsoleTestRunner(output, use_color=False)
+        test = pikzie.TestSuite([TestCase("test_nothing1"),
+                                 TestCase("test_nothing2")])
+        n_writes_on_finish = []
+        class Listener(object):
+            def on_finish_test(self, context, test):
+                n_writes_on_finish.append(output.n_writes)
+        runner.run(test, [Listener()])
+        self.assert_equal(([0, 0], 1),
+                          (n_writes_on_finish, output.n_writes))
+        self.assert_match("^..\nFinished in ", output.getvalue())
+
+    def test_buffered_output_flushed_by_timer(self):
+        class TestCase(pikzie.TestCase):
+            def test_long(self):
+                time.sleep(0.3)
+
+        output = StringIO()
+        runner = ConsoleTestRunner(output, use_color=False)
+        runner.flush_interval = 0.05
+        output_while_running = []
+        class Listener(object):
+            def on_finish_phase(self, context, test, phase):
+                if phase == "test":
+                    output_while_running.append(output.getvalue())
+        runner._write("x")
+        runner.run(pikzie.TestSuite([TestCase("test_long")]), [Listener()])
+        self.assert_equal(["x"], output_while_running)
+
+    def test_compact_retention(self):
+        class TestCase(pikzie.TestCase):
+            def test_success(self):
+                self.assert_true(True)
+
+            def test_failure(self):
+                self.unpicklable = lambda: None
+                self.assert_equal(1, 2)
+
+        context = pikzie.TestRunnerContext("compact")
+        TestCase("test_success").run(context)
+        TestCase("test_failure").run(context)
+        self.assert_equal(([("success", "test_runner.TestCase.test_success"),
+                            ("failure", "test_runner.TestCase.test_failure")],
+                           [("TestCase.test_failure", "1", "2")]),
+                          ([(result.name, result.test_id)
+                            for result in context.results],
+                           [(str(fault.test), fault.expected, fault.actual)
+                            for fault in context.iter_faults()]))
+
+    def test_lazy_traceback_content(self):
+        line_no = Source.current_line_no()
+        entry = pikzie.core.TracebackEntry(self.file_name, line_no, "test")
+        self.assert_equal((None, "line_no = Source.current_line_no()"),
+                          (entry._content, entry.content))
+
+    def test_relevant_codes_size(self):
+        class TestCase(pikzie.TestCase):
+            _relevant_codes = {}
+            _relevant_codes_size = 2
+
+            def test_failure(self):
+                self.assert_equal(1, 2)
+
+        context = pikzie.TestRunnerContext()
+        TestCase("test_failure").run(context)
+        self.assert_equal((["failure"], True),
+                          ([result.name for result in context.results],
+                           0 < len(TestCase._relevant_codes) <= 2))
+
+    def test_phases(self):
+        class TestCase(pikzie.TestCase):
+            def setup(self):
+                time.sleep(0.01)
+
+            def test_nothing(self):
+                pass
+
+        context = pikzie.TestRunnerContext()
+        TestCase("test_nothing").run(context)
+        phases = context.results[0].phases
+        self.assert_equal(["setup", "teardown", "test"], sorted(phases.keys()))
+        self.assert_true(phases["setup"] >= 0.01)
+        self.assert_equal(phases, context.test_case_phases)
+
+    def test_test_case_fixture(self):
+        class TestCase(pikzie.TestCase):
+            calls = []
+            result_store = ResultStore()
+
+            def setup_test_case(cls):
+                cls.calls.append("setup_test_case")
+                cls.shared = object()
+            setup_test_case = classmethod(setup_test_case)
+
+            def teardown_test_case(cls):
+                cls.calls.append("teardown_test_case")
+                raise IOError("teardown_test_case")
+            teardown_test_case = classmethod(teardown_test_case)
+
+            def test_one(self):
+                self.calls.append(self.shared)
+
+            def test_two(self):
+                self.calls.append(self.shared)
+
+        class Listener(object):
+            def __init__(self):
+                self.events = []
+
+            def on_error(self, context, error):
+                self.events.append(("error", error.test.short_name()))
+
+            def on_finish_test(self, context, test):
+                self.events.append(("finish", test.short_name()))
+
+        listener = Listener()
+        context = self._run_test_case_runner(TestCase, [listener])
+        shared = TestCase.shared
+        self.assert_equal((["setup_test_case", shared, shared,
+                            "teardown_test_case"],
+                           [("success", "test_one"),
+                            ("error", "test_two")],
+                           [("finish", "test_one"),
+                            ("error", "test_two"),
+                            ("finish", "test_two")],
+                           [True, False]),
+                          (TestCase.calls,
+                           [(result.name, result.test.short_name())
+                            for result in context.results],
+                           listener.events,
+                           [TestCase.result_store.get(TestCase(name).id(),
+                                                      "passed")
+                            for name in ["test_one", "test_two"]]))
+
+    def test_test_case_fixture_setup_error(self):
+        class TestCase(pikzie.TestCase):
+            calls = []
+
+            def setup_test_case(cls):
+                raise IOError("setup_test_case")
+            setup_test_case = classmethod(setup_test_case)
+
+            def teardown_test_case(cls):
+                cls.calls.append("teardown_test_case")
+            teardown_test_case = classmethod(teardown_test_case)
+
+            def test_one(self):
+                self.calls.append("test_one")
+
+            def test_two(self):
+                self.calls.append("test_two")
+
+        context = self._run_test_case_runner(TestCase)
+        self.assert_equal(([], 2, ["error", "error"]),
+                          (TestCase.calls, context.n_tests,
+                           [result.name for result in context.results]))
+
+    def _run_test_case_runner(self, test_case, listeners=[]):
+        runner = pikzie.core.TestCaseRunner(test_case,
+                                            [test_case("test_one"),
+                                             test_case("test_two")],
+                                            priority_mode=False)
+        context = pikzie.TestRunnerContext()
+        context.add_listeners(listeners)
+        runner.run(context)
+        return context
+
+    def test_listener_added_while_running(self):
+        class Listener(object):
+            def __init__(self):
+                self.n_successes = 0
+
+            def on_success(self, context, success):
+                self.n_successes += 1
+
+        class TestCase(pikzie.TestCase):
+            def test_nothing(self):
+                pass
+
+        listener = Listener()
+        context = pikzie.TestRunnerContext()
+        TestCase("test_nothing").run(context)
+        context.add_listener(listener)
+        TestCase("test_nothing").run(context)
+        self.assert_equal(1, listener.n_successes)
@@ -0,0 +1,67 @@
+import os
+import stat
+import socket
+import tempfile
+import threading
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import pikzie
+import pikzie.client
+from pikzie.server import TestServer, _prepare_private_directory
+from pikzie.utils import *
+
+fixture_dir = os.path.join(os.path.dirname(__file__),
+                           "fixtures", "module_based_test_cases")
+
+class TestServerAndClient(pikzie.TestCase):
+    """Tests for running tests in a server."""
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        rm_rf(self.tmp_dir)
+
+    def test_run(self):
+        server_connection, client_connection = socket.socketpair()
+        server = TestServer("unused.sock")
+        thread = threading.Thread(target=server.handle,
+                                  args=(server_connection,))
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        thread.start()
+        output = StringIO()
+        try:
+            status = pikzie.client.communicate(client_connection,
+                                               ["--base-dir", fixture_dir,
+                                                "--no-priority"],
+                                               output, use_color=False)
+        finally:
+            try:
+                client_connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            client_connection.close()
+            thread.join(10)
+            server_connection.close()
+            os.chdir(cwd)
+        self.assert_false(thread.is_alive())
+        self.assert_equal(1, status)
+        self.assert_match("F.\n\n1\\) Failure: ", output.getvalue())
+        self.assert_search("\n2 test\\(s\\), 2 assertion\\(s\\), "
+                           "1 failure\\(s\\)", output.getvalue())
+        self.assert_true(os.path.exists(os.path.join(self.tmp_dir,
+                                                     ".test-result")))
+
+    def test_private_directory(self):
+        directory = os.path.join(self.tmp_dir, "private")
+        _prepare_private_directory(directory)
+        self.assert_equal(int("700", 8),
+                          stat.S_IMODE(os.stat(directory).st_mode))
+        os.chmod(directory, int("755", 8))
+        self.assert_raise_call(OSError,
+                               _prepare_private_directory, directory)
@@ -0,0 +1,65 @@
+import os
+import pikzie
+import pikzie.shard
+from pikzie.result_store import ResultStore
+
+class TestShard(pikzie.TestCase):
+    """Tests for sharding"""
+
+    def test_parse_shard(self):
+        self.assert_equal((2, 4), pikzie.shard.parse_shard("2/4"))
+        self.assert_raise_call(ValueError, pikzie.shard.parse_shard, "5/4")
+        self.assert_raise_call(ValueError, pikzie.shard.parse_shard, "1-4")
+
+    def test_assign_shards_by_hash(self):
+        ids = ["test_%d" % i for i in range(20)]
+        shards = pikzie.shard.assign_shards(ids, 3)
+        self.assert_equal(shards,
+                          pikzie.shard.assign_shards(list(reversed(ids)),
+                                                     3)[::-1])
+        self.assert_equal([], [shard for shard in shards
+                               if not (1 <= shard <= 3)])
+
+    def test_assign_shards_by_duration(self):
+        ids = ["a", "b", "c", "d", "e"]
+        durations = [5.0, 4.0, 3.0, 2.0, 2.0]
+        self.assert_equal([1, 2, 2, 1, 1],
+                          pikzie.shard.assign_shards(ids, 2, durations))
+
+    def test_loader(self):
+        self.assert_equal(self._all_ids(), sorted(self._shard_ids(None)))
+
+    def test_loader_with_shard_durations(self):
+        durations = ResultStore()
+        durations.update("test_xxx.TestXXX1.test_one", elapsed=10.0)
+        durations.update("test_yyy.TestYYY.test_xyz", elapsed=9.0)
+        ids_of_shards = self._ids_of_shards(durations)
+        long_ids = ["test_xxx.TestXXX1.test_one", "test_yyy.TestYYY.test_xyz"]
+        self.assert_equal((self._all_ids(), []),
+                          (sorted(sum(ids_of_shards, [])),
+                           [ids for ids in ids_of_shards
+                            if long_ids[0] in ids and long_ids[1] in ids]))
+
+    def _shard_ids(self, durations):
+        return sum(self._ids_of_shards(durations), [])
+
+    def _ids_of_shards(self, durations):
+        fixture_dir = os.path.join("test", "fixtures", "tests")
+        ids_of_shards = []
+        for index in [1, 2, 3]:
+            loader = pikzie.TestLoader(base_dir=fixture_dir,
+                                       priority_mode=False,
+                                       shard=(index, 3),
+                                       shard_durations=durations)
+            ids = []
+            for runner in loader.create_test_suite():
+                ids.extend([test.id() for test in runner.tests()])
+            ids_of_shards.append(ids)
+        return ids_of_shards
+
+    def _all_ids(self):
+        return ["test_module_base.test_top_level1",
+                "test_module_base.test_top_level2",
+                "test_xxx.TestXXX1.test_one",
+                "test_xxx.TestXXX1.test_two",
+                "test_yyy.TestYYY.test_xyz"]
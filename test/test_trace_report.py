@@ -0,0 +1,45 @@
+import json
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import pikzie
+import pikzie.report
+
+class TestTraceReport(pikzie.TestCase):
+    """Tests for Trace Event Format report."""
+
+    class TestCase(pikzie.TestCase):
+        def test_assertions(self):
+            self.assert_true(True)
+            self.assert_equal(3, 1 + 2)
+
+    def test_spans(self):
+        output = StringIO()
+        report = pikzie.report.TraceEvents(output)
+        report.burst_gap = 60.0
+        context = pikzie.TestRunnerContext()
+        context.add_listener(report)
+        runner = pikzie.core.TestCaseRunner(self.TestCase,
+                                            [self.TestCase("test_assertions")],
+                                            priority_mode=False)
+        pikzie.TestSuite([runner]).run(context)
+        events = json.loads(output.getvalue())
+        self.assert_equal([("M", "thread_name"),
+                           ("B", "suite"),
+                           ("B", "TestCase"),
+                           ("B", "TestCase.test_assertions"),
+                           ("B", "setup"),
+                           ("E", "setup"),
+                           ("B", "test"),
+                           ("X", "assertions"),
+                           ("E", "test"),
+                           ("B", "teardown"),
+                           ("E", "teardown"),
+                           ("E", "TestCase.test_assertions"),
+                           ("E", "TestCase"),
+                           ("E", "suite")],
+                          [(event["ph"], event["name"]) for event in events])
+        self.assert_equal({"count": 2}, events[7]["args"])
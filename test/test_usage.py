@@ -0,0 +1,69 @@
+import pikzie
+from pikzie.result_store import ResultStore
+from pikzie.usage import UsageRecorder, format_size
+
+class TestUsage(pikzie.TestCase):
+    """Tests for measuring resource usage of tests."""
+
+    class TestCase(pikzie.TestCase):
+        def test_allocate(self):
+            self.data = [[] for i in range(10000)]
+        test_allocate = pikzie.metadata("max_memory", 1024)(test_allocate)
+
+        def test_nothing(self):
+            pass
+
+    def setup(self):
+        self.TestCase.result_store = ResultStore()
+
+    def test_usage(self):
+        context = self._run(UsageRecorder(), "test_nothing")
+        result = context.results[0]
+        self.assert_equal((["cpu_time", "peak_memory", "rss_delta"],
+                           "success"),
+                          (sorted(result.usage.keys()), result.name))
+        self.assert_equal(result.usage["cpu_time"],
+                          self.TestCase.result_store.get(
+                              "test_usage.TestCase.test_nothing", "cpu_time"))
+
+    def test_budget(self):
+        context = self._run(UsageRecorder(), "test_allocate")
+        self.assert_equal(["notification", "success"],
+                          [result.name for result in context.results])
+        self.assert_match("memory usage exceeded budget: .+ > 1KiB",
+                          context.results[0].message)
+
+    def test_strict_budget(self):
+        context = self._run(UsageRecorder(strict=True), "test_allocate")
+        self.assert_equal((["failure"], False, False),
+                          ([result.name for result in context.results],
+                           context.succeeded,
+                           self.TestCase.result_store.get(
+                               "test_usage.TestCase.test_allocate",
+                               "passed")))
+
+    def test_concurrent(self):
+        recorder = UsageRecorder()
+        context = pikzie.TestRunnerContext()
+        context.concurrent = True
+        test = self.TestCase("test_nothing")
+        recorder.on_start_phase(context, test, "setup")
+        recorder.on_finish_phase(context, test, "teardown")
+        self.assert_equal(({}, None),
+                          (context.test_usage,
+                           self.TestCase.result_store.get(test.id(),
+                                                          "cpu_time")))
+
+    def test_format_size(self):
+        self.assert_equal(["512B", "2KiB", "3MiB", "1.5GiB"],
+                          [format_size(512), format_size(2048),
+                           format_size(3 * 1024 * 1024),
+                           format_size(1536 * 1024 * 1024)])
+
+    def _run(self, recorder, name):
+        context = pikzie.TestRunnerContext()
+        context.add_listener(recorder)
+        suite = pikzie.TestSuite([self.TestCase(name)])
+        suite.run(context)
+        return context
+
@@ -1,5 +1,7 @@
+import os
 import re
-import cgi
+import tempfile
+from xml.sax.saxutils import escape
 
 try:
     from exceptions import *
@@ -14,6 +16,7 @@ except ImportError:
 import pikzie
 import pikzie.report
 import pikzie.ui.console
+from pikzie.utils import *
 from test.utils import *
 
 ConsoleTestRunner = pikzie.ui.console.ConsoleTestRunner
@@ -57,10 +60,10 @@ class TestXMLReport(pikzie.TestCase, Assertions):
     <status>success</status>
     <detail/>
     <elapsed>%s</elapsed>
-  </result>
+%s  </result>
 </report>
 """
-        xml = (xml.strip() + "\n") % elapsed
+        xml = (xml.strip() + "\n") % (elapsed, self._phases(elapsed))
         self.assert_xml(xml, self._suite(["_test_success"]), elapsed)
 
     def test_failure_result(self):
@@ -83,7 +86,7 @@ class TestXMLReport(pikzie.TestCase, Assertions):
     <status>failure</status>
     <detail>expected: &lt;False&gt; is a true value</detail>
     <elapsed>%s</elapsed>
-    <backtrace>
+%s    <backtrace>
       <entry>
         <file>%s</file>
         <line>%s</line>
@@ -94,6 +97,7 @@ class TestXMLReport(pikzie.TestCase, Assertions):
 </report>
 """
         xml = xml % (elapsed,
+                     self._phases(elapsed),
                      Source.current_file(),
                      self.TestCase.TEST_FAILURE_LINE)
         xml = xml.strip() + "\n"
@@ -115,7 +119,7 @@ class TestXMLReport(pikzie.TestCase, Assertions):
     <status>error</status>
     <detail>%s</detail>
     <elapsed>%s</elapsed>
-    <backtrace>
+%s    <backtrace>
       <entry>
         <file>%s</file>
         <line>%s</line>
@@ -127,13 +131,61 @@ class TestXMLReport(pikzie.TestCase, Assertions):
 """
         xml = xml % (("%s: 'TestCase' object has no attribute " +
                       "'non_existence_method'") % \
-                         cgi.escape(str(AttributeError)),
+                         escape(str(AttributeError)),
                      elapsed,
+                     self._phases(elapsed),
                      Source.current_file(),
                      self.TestCase.TEST_ERROR_LINE)
         xml = xml.strip() + "\n"
         self.assert_xml(xml, self._suite(["_test_error"]), elapsed)
 
+    def test_merge(self):
+        result1 = \
+            "  <result>\n" \
+            "    <status>success</status>\n" \
+            "  </result>\n"
+        result2 = \
+            "  <result>\n" \
+            "    <status>failure</status>\n" \
+            "  </result>\n"
+        reports = ["<report>\n%s</report>\n" % result1,
+                   "<report/>\n",
+                   "<report>\n%s</report>\n" % result2,
+                   "<?xml version='1.0'?>\n"
+                   "<report><result>\n"
+                   "    <status>error</status>\n"
+                   "  </result></report>"]
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            inputs = []
+            for i, report in enumerate(reports):
+                input = os.path.join(tmp_dir, "report%d.xml" % i)
+                input_file = open(input, "w")
+                input_file.write(report)
+                input_file.close()
+                inputs.append(input)
+            merged_report = StringIO()
+            pikzie.report.merge_xml_reports(inputs, merged_report)
+        finally:
+            rm_rf(tmp_dir)
+        result3 = \
+            "  <result>\n" \
+            "    <status>error</status>\n" \
+            "  </result>\n"
+        self.assert_equal("<report>\n%s%s%s</report>\n" % (result1, result2,
+                                                           result3),
+                          merged_report.getvalue())
+
+    def _phases(self, elapsed):
+        phases = ["    <phases>\n"]
+        for name in ["setup", "test", "teardown"]:
+            phases.append("      <phase>\n"
+                          "        <name>%s</name>\n"
+                          "        <elapsed>%s</elapsed>\n"
+                          "      </phase>\n" % (name, elapsed))
+        phases.append("    </phases>\n")
+        return "".join(phases)
+
     def _suite(self, names=[]):
         return pikzie.TestSuite([self.TestCase(name) for name in names])
 